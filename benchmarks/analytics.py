@@ -0,0 +1,107 @@
+"""Benchmark the analysis queries on SQLite against DuckDB over the Parquet mirror
+
+Copies the database into a temporary directory and adds synthetic scenario invoices.
+
+Usage: python benchmarks/analytics.py [--invoices 200000] [--repeat 3]
+"""
+
+import argparse
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from sqlmodel import Session, SQLModel, create_engine, insert
+
+from generate_inv import DB_FILE
+from generate_inv.analytics import ANALYZE_QUERIES, analytics_connection, mirror_to_parquet
+from generate_inv.invoice import template_hash
+from generate_inv.jobs import invoice_records
+from generate_inv.migrations import migrate
+from generate_inv.models import InvoiceLine, InvoiceRecord, Job
+from generate_inv.scenario import Scenario, ScenarioConfig
+from generate_inv.types import JobKind, JobStatus
+
+BATCH_INVOICES = 10_000
+
+
+def add_invoices(db_file: Path, invoices: int) -> None:
+    """Insert scenario invoice records under a new job
+
+    Rows are built like the rows of `generate-inv invoice`, so they follow the
+    current schema. The copied database is migrated first.
+    """
+    scenario = Scenario(ScenarioConfig(seed=1))
+    template = template_hash()
+    engine = create_engine(f"sqlite:///{db_file}")
+    SQLModel.metadata.create_all(engine)
+    migrate(engine)
+
+    with Session(engine) as session:
+        job = Job(kind=JobKind.INVOICE, params="{}", total=invoices, status=JobStatus.COMPLETED)
+        session.add(job)
+        session.commit()
+        for start in range(0, invoices, BATCH_INVOICES):
+            records, lines = [], []
+            for sequence in range(start, min(start + BATCH_INVOICES, invoices)):
+                invoice = scenario.sample(sequence)
+                for row in invoice_records(job.id, sequence, invoice, template):
+                    rows = records if isinstance(row, InvoiceRecord) else lines
+                    rows.append(row.model_dump())
+            session.execute(insert(InvoiceRecord), records)
+            session.execute(insert(InvoiceLine), lines)
+            session.commit()
+    engine.dispose()
+
+
+def best_time(run, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--invoices", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = Path(directory, "benchmark.db")
+        with sqlite3.connect(DB_FILE) as source, sqlite3.connect(db_file) as target:
+            source.backup(target)
+
+        started = time.perf_counter()
+        add_invoices(db_file, args.invoices)
+        print(f"Added {args.invoices} invoices in {time.perf_counter() - started:.1f} s")
+
+        parquet_dir = Path(directory, "parquet")
+        started = time.perf_counter()
+        mirror_to_parquet(db_file, parquet_dir)
+        print(f"Parquet mirror in {time.perf_counter() - started:.1f} s")
+
+        sqlite_connection = sqlite3.connect(db_file)
+        duckdb_connection = analytics_connection(db_file, parquet_dir)
+
+        print(f"{'query':<22} {'sqlite ms':>10} {'duckdb ms':>10} {'speedup':>8}")
+        for title, query in ANALYZE_QUERIES.items():
+            sqlite_time = best_time(
+                lambda query=query: sqlite_connection.execute(query).fetchall(), args.repeat
+            )
+            duckdb_time = best_time(
+                lambda query=query: duckdb_connection.execute(query).fetchall(), args.repeat
+            )
+            print(
+                f"{title:<22} {sqlite_time * 1000:>10.1f} {duckdb_time * 1000:>10.1f} "
+                f"{sqlite_time / duckdb_time:>7.1f}x"
+            )
+
+        sqlite_connection.close()
+        duckdb_connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Offline benchmark of request hedging against a simulated-latency model
+
+Usage: python benchmarks/llm_policy.py [--requests 1000] [--concurrency 20]
+"""
+
+import argparse
+import asyncio
+import time
+
+from pydantic import BaseModel
+from pydantic_ai import Agent
+
+from generate_inv.llm import RequestPolicy, simulated_model
+
+
+class Row(BaseModel):
+    name: str
+
+
+def percentile(values: list[float], quantile: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * quantile), len(values) - 1)]
+
+
+async def measure(policy: RequestPolicy, agent: Agent, requests: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def request() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await policy.run_async(agent, "rows")
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(request() for _ in range(requests)))
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--median", type=float, default=0.05, help="Median latency, seconds")
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-factor", type=float, default=20.0)
+    args = parser.parse_args()
+
+    model = simulated_model(
+        [{"name": "row"}], args.median, args.slow_rate, args.slow_factor, seed=42
+    )
+    agent = Agent(model=model, result_type=list[Row])
+    policies = {
+        "plain": RequestPolicy(deadline=60, hedge_after=None),
+        "hedged": RequestPolicy(deadline=60, hedge_after=args.median * 4),
+    }
+
+    print(f"{'policy':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'hedged':>7}")
+    for name, policy in policies.items():
+        latencies = asyncio.run(measure(policy, agent, args.requests, args.concurrency))
+        p50, p95, p99 = (percentile(latencies, q) * 1000 for q in (0.5, 0.95, 0.99))
+        print(f"{name:<8} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} {policy.hedged:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Load test a running `generate-inv serve` instance
+
+Usage: python benchmarks/load_test.py [--url http://127.0.0.1:8000] [--requests 1000]
+       [--concurrency 16] [--format pdf] [--distinct 1000]
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+
+def percentile(values: list[float], quantile: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * quantile), len(values) - 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--format", default="pdf", choices=["pdf", "html", "png", "json"])
+    parser.add_argument("--distinct", type=int, default=1000, help="Number of distinct seeds")
+    args = parser.parse_args()
+
+    def request(number: int) -> tuple[float, int]:
+        url = f"{args.url}/invoice?seed={number % args.distinct}&format={args.format}"
+        started = time.perf_counter()
+        with urlopen(url) as response:
+            size = len(response.read())
+        return time.perf_counter() - started, size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(request, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, _ in results]
+    total_bytes = sum(size for _, size in results)
+    print(f"Requests:     {args.requests} ({args.format}, concurrency {args.concurrency})")
+    print(f"Requests/sec: {args.requests / elapsed:.1f}")
+    print(f"Bytes/sec:    {total_bytes / elapsed:,.0f}")
+    for quantile in (0.5, 0.95, 0.99):
+        print(f"p{int(quantile * 100):<2} latency: {percentile(latencies, quantile) * 1000:.1f} ms")
+    print(f"max latency: {max(latencies) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
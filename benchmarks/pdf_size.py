@@ -0,0 +1,44 @@
+"""Benchmark PDF size and render time per optimization level
+
+Usage: python benchmarks/pdf_size.py [--invoices 50] [--seed 0]
+"""
+
+import argparse
+import time
+
+from generate_inv.invoice import render_invoice
+from generate_inv.scenario import Scenario, ScenarioConfig
+from generate_inv.types import PdfOptimize
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--invoices", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    scenario = Scenario(ScenarioConfig(seed=args.seed))
+    invoices = [scenario.sample(sequence) for sequence in range(args.invoices)]
+
+    print(f"{'optimize':<9} {'bytes/invoice':>14} {'ms/invoice':>11} {'size':>7}")
+    baseline = None
+    for optimize in PdfOptimize:
+        # The first render of a level loads fonts and fetches the logo into the image
+        # cache of that level, keep it out of the timings
+        render_invoice(invoices[0], scenario.addresses, optimize=optimize).pdf()
+        started = time.perf_counter()
+        total_bytes = sum(
+            len(render_invoice(invoice, scenario.addresses, optimize=optimize).pdf())
+            for invoice in invoices
+        )
+        elapsed = time.perf_counter() - started
+        average = total_bytes / len(invoices)
+        baseline = baseline or average
+        print(
+            f"{optimize.value:<9} {average:>14,.0f} {elapsed / len(invoices) * 1000:>11.1f} "
+            f"{average / baseline:>7.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
 """Typer CLI for generate_inv"""
 
+import os
 from importlib.metadata import metadata
 from pathlib import Path
 from typing import Annotated
 
+import dotenv
 from rich.console import Console as RichConsole
 from rich.traceback import install as rich_traceback
-from typer import Exit, Option, Typer
+from typer import BadParameter, Exit, Option, Typer
+
+# Option types must exist when the commands are defined, types.py only holds enums
+from .types import DocumentFormat, OutputFormat, PdfOptimize
 
 __version__ = metadata(__package__).get("version")
 package_name = metadata(__package__).get("name")
@@ -15,33 +20,66 @@ root_dir = Path(__file__).parent
 CONFIG_FILE = Path.home() / ".config" / package_name / "config.env"
 CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-DB_FILE = Path.home() / ".local" / "share" / package_name / f"{package_name}.db"
+dotenv.load_dotenv(CONFIG_FILE)
+
+DB_FILE = Path(
+    os.getenv(
+        "GENERATE_INV_DB_FILE",
+        Path.home() / ".local" / "share" / package_name / f"{package_name}.db",
+    )
+).expanduser()
 DB_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-INV_DIR = Path.home() / "Downloads" / package_name
+INV_DIR = Path(
+    os.getenv("GENERATE_INV_OUTPUT_DIR", Path.home() / "Downloads" / package_name)
+).expanduser()
 INV_DIR.mkdir(parents=True, exist_ok=True)
 
+ARCHIVE_MAX_DOCS = 10_000
+ARCHIVE_MAX_BYTES = 1_000_000_000
+
 rich_traceback(show_locals=True, max_frames=5)
 console = RichConsole()
 
 cli = Typer(no_args_is_help=True)
 
 
+def parse_shard(value: str | None) -> tuple[int, int] | None:
+    """Parse `i/N` shard specification into zero-based shard index and shard count"""
+    if value is None:
+        return None
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise BadParameter("Shard must be in the form i/N, for example 0/4") from None
+    if count < 1 or not 0 <= index < count:
+        raise BadParameter("Shard index must be in the range 0 <= i < N")
+    return index, count
+
+
 @cli.command(no_args_is_help=True)
 def address(
     generate: Annotated[int | None, Option(help="Generate addresses", show_default=False)] = None,
     list: Annotated[bool | None, Option("--list", help="List addresses")] = None,
+    stream: Annotated[
+        bool, Option("--stream", help="Store rows as the model streams them")
+    ] = False,
+    resume: Annotated[int | None, Option(help="Resume job by job ID", show_default=False)] = None,
 ) -> None:
     """Generate synthetic addresses (5 items per run)"""
 
     from .address import generate_addresses, list_addresses
+    from .jobs import create_job, get_job, run_batch_job
     from .models import create_db_schema
+    from .types import JobKind
 
-    if generate:
-        for count in range(generate):
-            console.print(f"Generating address batch {count + 1} out of {generate}")
-            create_db_schema()
-            generate_addresses()
+    if generate or resume:
+        create_db_schema()
+        if resume:
+            job = get_job(resume, JobKind.ADDRESS)
+        else:
+            job = create_job(JobKind.ADDRESS, generate, {"stream": stream})
+        run_batch_job(job, generate_addresses, "address")
         raise Exit(0)
 
     elif list:
@@ -53,16 +91,24 @@ def address(
 def company(
     generate: Annotated[int | None, Option(help="Generate company", show_default=False)] = None,
     list: Annotated[bool | None, Option("--list", help="List Company")] = None,
+    stream: Annotated[
+        bool, Option("--stream", help="Store rows as the model streams them")
+    ] = False,
+    resume: Annotated[int | None, Option(help="Resume job by job ID", show_default=False)] = None,
 ) -> None:
     """Generate synthetic company"""
     from .company import generate_company, list_companies
+    from .jobs import create_job, get_job, run_batch_job
     from .models import create_db_schema
+    from .types import JobKind
 
-    if generate:
-        for count in range(generate):
-            console.print(f"Generating company batch {count + 1} out of {generate}")
-            create_db_schema()
-            generate_company()
+    if generate or resume:
+        create_db_schema()
+        if resume:
+            job = get_job(resume, JobKind.COMPANY)
+        else:
+            job = create_job(JobKind.COMPANY, generate, {"stream": stream})
+        run_batch_job(job, generate_company, "company")
         raise Exit(0)
 
     elif list:
@@ -77,17 +123,25 @@ def invoice_item(
         Option(help="Generate invoice items", show_default=False),
     ] = None,
     list: Annotated[bool | None, Option("--list", help="List Invoice Items")] = None,
+    stream: Annotated[
+        bool, Option("--stream", help="Store rows as the model streams them")
+    ] = False,
+    resume: Annotated[int | None, Option(help="Resume job by job ID", show_default=False)] = None,
 ) -> None:
     """Generate synthetic invoice items (5 items per run)"""
 
-    if generate:
+    if generate or resume:
         from .invoice_item import generate_invoice_items
+        from .jobs import create_job, get_job, run_batch_job
         from .models import create_db_schema
+        from .types import JobKind
 
         create_db_schema()
-        for count in range(generate):
-            console.print(f"Generating invoice items batch {count + 1} out of {generate}")
-            generate_invoice_items()
+        if resume:
+            job = get_job(resume, JobKind.INVOICE_ITEM)
+        else:
+            job = create_job(JobKind.INVOICE_ITEM, generate, {"stream": stream})
+        run_batch_job(job, generate_invoice_items, "invoice items")
         raise Exit(0)
 
     elif list:
@@ -98,27 +152,149 @@ def invoice_item(
 
 
 @cli.command(no_args_is_help=True)
-def invoice(
+def invoice(  # noqa: PLR0913, PLR0917, one parameter per Typer option
     generate: Annotated[int | None, Option(help="Generate invoices", show_default=False)] = None,
-    output: Annotated[str | None, Option(help="Output directory")] = INV_DIR,
+    output: Annotated[Path, Option(help="Output directory", file_okay=False)] = INV_DIR,
+    document_format: Annotated[
+        list[DocumentFormat] | None,
+        Option(
+            "--format",
+            help="Document format, repeat to write several formats from one render",
+            show_default="pdf",
+        ),
+    ] = None,
+    output_format: Annotated[
+        OutputFormat, Option(help="Write loose files or rolling ZIP/tar archives")
+    ] = OutputFormat.DIR,
+    archive_max_docs: Annotated[
+        int, Option(help="Maximum number of documents per archive", min=1)
+    ] = ARCHIVE_MAX_DOCS,
+    archive_max_bytes: Annotated[
+        int, Option(help="Maximum archive size in bytes", min=1)
+    ] = ARCHIVE_MAX_BYTES,
+    shard: Annotated[
+        str | None,
+        Option(help="Generate only shard i of N (i/N) of the invoices", show_default=False),
+    ] = None,
+    scenario: Annotated[
+        Path | None,
+        Option(help="Scenario distribution config TOML file", exists=True, dir_okay=False),
+    ] = None,
+    seed: Annotated[int | None, Option(help="Random seed", show_default=False)] = None,
+    workers: Annotated[int, Option(help="Number of render worker processes", min=1)] = 1,
+    pdf_optimize: Annotated[
+        PdfOptimize,
+        Option(help="PDF size optimization: image options, max adds post-compression"),
+    ] = PdfOptimize.OFF,
+    resume: Annotated[int | None, Option(help="Resume job by job ID", show_default=False)] = None,
+    rerender_changed: Annotated[
+        bool,
+        Option(help="Re-render stored invoices whose template or source rows changed"),
+    ] = False,
 ) -> None:
     """Generate synthetic invoices"""
-    from .invoice import generate_invoice, write_invoice
+    from .jobs import create_job, get_job, run_invoice_job
+    from .models import create_db_schema
+    from .scenario import ScenarioConfig
+    from .types import JobKind
+
+    if rerender_changed:
+        from .jobs import rerender_changed as rerender
+
+        create_db_schema()
+        rerender(workers)
+        raise Exit(0)
+
+    if resume:
+        create_db_schema()
+        run_invoice_job(get_job(resume, JobKind.INVOICE))
+        raise Exit(0)
 
     if generate:
-        for count in range(generate):
-            console.print(f"Generating invoice {count + 1} out of {generate}")
-            invoice = generate_invoice()
-            pdf_bytes = write_invoice(invoice)
-            Path(INV_DIR).joinpath(f"{invoice.invoice_number}.pdf").write_bytes(pdf_bytes)
+        create_db_schema()
+        config = ScenarioConfig.from_toml(scenario) if scenario else ScenarioConfig()
+        if seed is not None:
+            config.seed = seed
+
+        # Every shard takes every N-th invoice number, the seed of each invoice derives from it
+        shard_index, shard_count = parse_shard(shard) or (0, 1)
+        params = {
+            "generate": generate,
+            "output": str(output.resolve()),
+            "formats": [value.value for value in document_format or [DocumentFormat.PDF]],
+            "output_format": output_format.value,
+            "archive_max_docs": archive_max_docs,
+            "archive_max_bytes": archive_max_bytes,
+            "shard": [shard_index, shard_count],
+            "prefix": f"invoices-{shard_index}-of-{shard_count}" if shard else "invoices",
+            "scenario": config.model_dump(mode="json"),
+            "pdf_optimize": pdf_optimize.value,
+        }
+        total = len(range(shard_index, generate, shard_count))
+        job = create_job(JobKind.INVOICE, total, params, config.seed, workers)
+        run_invoice_job(job)
+        raise Exit(0)
+
+
+@cli.command()
+def serve(  # noqa: PLR0913, PLR0917, one parameter per Typer option
+    host: Annotated[str, Option(help="Listen address")] = "127.0.0.1",
+    port: Annotated[int, Option(help="Listen port")] = 8000,
+    workers: Annotated[int, Option(help="Number of warm render worker processes", min=1)] = 1,
+    scenario: Annotated[
+        Path | None,
+        Option(help="Scenario distribution config TOML file", exists=True, dir_okay=False),
+    ] = None,
+    seed: Annotated[int | None, Option(help="Random seed", show_default=False)] = None,
+    batch_size: Annotated[int, Option(help="Maximum invoices per worker task", min=1)] = 16,
+    batch_wait: Annotated[
+        float, Option(help="Seconds to wait for more requests to batch", min=0)
+    ] = 0.005,
+    pdf_optimize: Annotated[
+        PdfOptimize,
+        Option(help="PDF size optimization: image options, max adds post-compression"),
+    ] = PdfOptimize.OFF,
+) -> None:
+    """Serve invoices over HTTP: GET /invoice?seed=N&format=pdf|html|png|json"""
+    from .models import create_db_schema
+    from .scenario import ScenarioConfig
+    from .server import serve
+
+    create_db_schema()
+    config = ScenarioConfig.from_toml(scenario) if scenario else ScenarioConfig()
+    if seed is not None:
+        config.seed = seed
+
+    serve(
+        config,
+        host=host,
+        port=port,
+        workers=workers,
+        batch_size=batch_size,
+        batch_wait=batch_wait,
+        optimize=pdf_optimize,
+    )
+    raise Exit(0)
 
-        console.print(f"Output file: {output}")
+
+@cli.command(no_args_is_help=True)
+def job(
+    list: Annotated[bool | None, Option("--list", help="List generation jobs")] = None,
+) -> None:
+    """List resumable generation jobs"""
+    from .jobs import list_jobs
+
+    if list:
+        list_jobs()
         raise Exit(0)
 
 
 @cli.command(no_args_is_help=True)
-def database(
+def database(  # noqa: PLR0913, PLR0917, one parameter per Typer option
     stats: Annotated[bool | None, Option("--stats", help="Show database statistics")] = None,
+    exact: Annotated[
+        bool | None, Option("--exact", help="Recompute statistics with --stats")
+    ] = None,
     create_schema: Annotated[
         bool | None, Option("--create-schema", help="Create database DDL schema")
     ] = None,
@@ -128,13 +304,27 @@ def database(
     drop_schema: Annotated[
         bool | None, Option("--drop-schema", help="Create database DDL schema")
     ] = None,
+    analyze: Annotated[
+        bool | None,
+        Option("--analyze", help="Run analytics queries on a DuckDB Parquet mirror"),
+    ] = None,
+    merge: Annotated[
+        list[Path] | None,
+        Option(
+            "--merge",
+            help="Merge shard database into the current database (repeatable)",
+            exists=True,
+            dir_okay=False,
+            show_default=False,
+        ),
+    ] = None,
 ) -> None:
     """Database operations"""
 
     if stats:
         from .database import show_stats
 
-        show_stats()
+        show_stats(exact=bool(exact))
         raise Exit(0)
 
     elif create_schema:
@@ -157,6 +347,20 @@ def database(
         console.print("Created database schema")
         raise Exit(0)
 
+    elif merge:
+        from .database import merge_databases
+
+        merge_databases(merge)
+        raise Exit(0)
+
+    elif analyze:
+        from .analytics import analyze
+        from .models import create_db_schema
+
+        create_db_schema()
+        analyze()
+        raise Exit(0)
+
 
 @cli.command(no_args_is_help=True)
 def settings(
@@ -2,18 +2,24 @@
 
 import json
 
-from pydantic_ai import Agent, UserError
-from sqlalchemy.exc import IntegrityError
+from pydantic_ai import Agent
 from sqlmodel import Session, select
 
 from . import console
-from .database import DB_ENGINE
+from .database import DB_ENGINE, RowInserter
+from .dedup import NearDuplicateIndex
+from .llm import BATCH_SIZE, STREAM_EXTRA_ROWS, request_policy, stream_rows
 from .models import Address
 from .settings import ANTHROPIC_MODEL
+from .stats import record_rows
 
 
-def generate_addresses() -> bool:
-    """Generate 5 invoice items and store in database"""
+def generate_addresses(stream: bool = False) -> bool:
+    """Generate 5 addresses and store in database
+
+    Args:
+        stream: Store each address as soon as it is streamed, stop after 5 new addresses
+    """
 
     with Session(DB_ENGINE) as session:
         present_addresses = session.exec(select(Address.address_line1)).all()
@@ -25,8 +31,11 @@ def generate_addresses() -> bool:
 
     json_schema = json.dumps(Address.model_json_schema())
 
+    # Streaming asks for spare rows and cancels the stream once the batch is stored
+    count = BATCH_SIZE + STREAM_EXTRA_ROWS if stream else BATCH_SIZE
+
     user_prompt = (
-        f"Generate 5 unique Canadian postal addresses. "
+        f"Generate {count} unique Canadian postal addresses. "
         f"Use JSON schema for each invoice line item: <json_schema>{json_schema}</json_schema>. "
         "Do not use item_sku or item_info that are present in the database. "
         f"Here is the list of item_sku and item_info in the current database: <database_data>{present_addresses}</database_data>. "
@@ -42,28 +51,32 @@ def generate_addresses() -> bool:
         },
     )
 
-    try:
-        console.print("Waiting for AI to generate addresses...")
-        result = agent.run_sync(user_prompt=user_prompt)
-    except UserError as error:
-        console.print(error)
-        return False
-
-    new, dup = 0, 0
+    policy = request_policy()
+    success = True
     with Session(DB_ENGINE) as session:
-        for item in result.data:
-            session.add(item)
-            try:
-                session.commit()
-                new += 1
-            except IntegrityError:
-                session.rollback()
-                dup += 1
-                continue
-
-    console.print(f"New addresses: {new}, duplicate addresses: {dup}")
-
-    return True
+        insert = RowInserter(session, NearDuplicateIndex(session, Address))
+        try:
+            if stream:
+                console.print("Streaming AI generated addresses...")
+                stream_rows(agent, user_prompt, insert, BATCH_SIZE, policy.deadline)
+            else:
+                console.print("Waiting for AI to generate addresses...")
+                rows = policy.run(agent, user_prompt)
+                for item in rows:
+                    insert(item)
+        except Exception as error:
+            console.print(error)
+            success = False
+
+        record_rows(session, Address, insert.new)
+        session.commit()
+
+    console.print(
+        f"New addresses: {insert.new}, duplicate addresses: {insert.dup}, "
+        f"near-duplicate addresses: {insert.near}"
+    )
+
+    return success
 
 
 def list_addresses() -> None:
@@ -0,0 +1,154 @@
+"""DuckDB analytics over a columnar Parquet mirror of the database"""
+
+import csv
+import sqlite3
+from pathlib import Path
+
+from rich.table import Table
+
+from . import DB_FILE, console
+
+PARQUET_DIR = DB_FILE.parent.joinpath("parquet")
+MIRROR_TABLES = ["address", "company", "invoiceitem", "invoicerecord", "invoiceline"]
+MIRROR_BATCH_ROWS = 50_000
+TOTALS_BUCKET = 1000
+
+# Plain SQL that runs unchanged on DuckDB and SQLite, for the benchmark
+ANALYZE_QUERIES: dict[str, str] = {
+    "Revenue per Supplier": """
+        SELECT c.company_name AS supplier, r.currency, count(*) AS invoices,
+               round(sum(r.total), 2) AS revenue
+        FROM invoicerecord r JOIN company c ON c.id = r.supplier_id
+        GROUP BY c.company_name, r.currency
+        ORDER BY revenue DESC
+        LIMIT 20
+    """,
+    "Item Frequency": """
+        SELECT i.item_sku, i.item_info, count(*) AS lines, sum(l.quantity) AS quantity
+        FROM invoiceline l JOIN invoiceitem i ON i.id = l.item_id
+        GROUP BY i.item_sku, i.item_info
+        ORDER BY lines DESC
+        LIMIT 20
+    """,
+    "Totals Distribution": f"""
+        SELECT CAST(floor(total / {TOTALS_BUCKET}) * {TOTALS_BUCKET} AS INTEGER) AS total_from,
+               count(*) AS invoices
+        FROM invoicerecord
+        GROUP BY total_from
+        ORDER BY total_from
+    """,
+}
+
+
+def _duckdb():
+    try:
+        import duckdb  # noqa: PLC0415, optional dependency
+    except ImportError:
+        raise RuntimeError(
+            "Analytics require duckdb, install it with `pip install generate-inv[analytics]`"
+        ) from None
+    return duckdb
+
+
+def mirror_to_parquet(db_file: Path = DB_FILE, parquet_dir: Path = PARQUET_DIR) -> None:
+    """Copy the database tables into Parquet files, one file per table
+
+    The DuckDB `sqlite` extension scans the database directly. When the extension
+    cannot be loaded, tables are streamed through a temporary CSV file instead.
+    Paths and table names are bound as query parameters.
+    """
+    duckdb = _duckdb()
+    parquet_dir.mkdir(parents=True, exist_ok=True)
+
+    with duckdb.connect() as connection:
+        try:
+            connection.execute("INSTALL sqlite; LOAD sqlite")
+            scan = True
+        except duckdb.Error:
+            scan = False
+
+        for table_name in MIRROR_TABLES:
+            path = parquet_dir.joinpath(f"{table_name}.parquet")
+            partial_path = path.with_name(f"{path.name}.part")
+            csv_path = path.with_name(f"{table_name}.csv.part")
+            if scan:
+                source = "sqlite_scan($db_file, $table_name)"
+                parameters = {"db_file": str(db_file), "table_name": table_name}
+            else:
+                source = "read_csv($csv_file, header = true, columns = $columns)"
+                columns = _export_csv(db_file, table_name, csv_path)
+                parameters = {"csv_file": str(csv_path), "columns": columns}
+            connection.execute(
+                f"COPY (SELECT * FROM {source}) TO $parquet_file (FORMAT parquet, COMPRESSION zstd)",
+                {**parameters, "parquet_file": str(partial_path)},
+            )
+            partial_path.replace(path)
+            csv_path.unlink(missing_ok=True)
+
+    console.print(f"Mirrored {len(MIRROR_TABLES)} tables to {parquet_dir}")
+
+
+def _quote_identifier(name: str) -> str:
+    """Quote a table name for SQL statements where it cannot be a parameter"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _export_csv(db_file: Path, table_name: str, csv_path: Path) -> dict[str, str]:
+    """Write a SQLite table to CSV, return the DuckDB `read_csv` column types for it"""
+    with sqlite3.connect(db_file) as source, csv_path.open("w", newline="") as file:
+        columns = source.execute(
+            "SELECT name, type FROM pragma_table_info(?)", (table_name,)
+        ).fetchall()
+        writer = csv.writer(file)
+        writer.writerow(name for name, _ in columns)
+        cursor = source.execute(f"SELECT * FROM {_quote_identifier(table_name)}")
+        while rows := cursor.fetchmany(MIRROR_BATCH_ROWS):
+            writer.writerows(rows)
+
+    # SQLite NUMERIC columns hold the Decimal fields, they are mirrored as DOUBLE
+    types = {"INTEGER": "BIGINT", "NUMERIC": "DOUBLE", "DATE": "DATE"}
+    return {name: types.get(column_type.split("(")[0], "VARCHAR") for name, column_type in columns}
+
+
+def analytics_connection(db_file: Path = DB_FILE, parquet_dir: Path = PARQUET_DIR):
+    """DuckDB connection with a view per mirrored table
+
+    The Parquet mirror is refreshed first when the database changed after it was written.
+    """
+    duckdb = _duckdb()
+    paths = [parquet_dir.joinpath(f"{table_name}.parquet") for table_name in MIRROR_TABLES]
+    if not all(path.exists() for path in paths) or db_file.stat().st_mtime > min(
+        path.stat().st_mtime for path in paths
+    ):
+        mirror_to_parquet(db_file, parquet_dir)
+
+    connection = duckdb.connect()
+    for table_name, path in zip(MIRROR_TABLES, paths, strict=True):
+        # Views cannot hold query parameters, the relation API takes the path as is
+        connection.read_parquet(str(path)).create_view(table_name)
+    return connection
+
+
+def run_queries(connection) -> dict[str, tuple[list[str], list[tuple]]]:
+    """Run the analysis queries, return column names and rows by query title"""
+    results = {}
+    for title, query in ANALYZE_QUERIES.items():
+        cursor = connection.execute(query)
+        columns = [column[0] for column in cursor.description]
+        results[title] = (columns, cursor.fetchall())
+    return results
+
+
+def analyze() -> None:
+    """Show revenue per supplier, item frequency and totals distribution"""
+    with analytics_connection() as connection:
+        results = run_queries(connection)
+
+    with console.pager(styles=True):
+        for title, (columns, rows) in results.items():
+            table = Table(title=title)
+            for column in columns:
+                table.add_column(column, style="cyan")
+            for row in rows:
+                table.add_row(*(str(value) for value in row))
+            console.print(table)
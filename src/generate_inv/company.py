@@ -3,18 +3,24 @@
 import json
 
 from pydantic_ai import Agent
-from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, func, select
 
 from . import console
 from .address import Address
-from .database import DB_ENGINE
+from .database import DB_ENGINE, RowInserter
+from .dedup import NearDuplicateIndex
+from .llm import BATCH_SIZE, STREAM_EXTRA_ROWS, request_policy, stream_rows
 from .models import Company
 from .settings import ANTHROPIC_MODEL
+from .stats import record_rows
 
 
-def generate_company() -> bool:
-    """Generate synthetic company data"""
+def generate_company(stream: bool = False) -> bool:
+    """Generate synthetic company data
+
+    Args:
+        stream: Store each company as soon as it is streamed, stop after 5 new companies
+    """
 
     with Session(DB_ENGINE) as session:
         statement = select(Company.company_id, Company.company_name)
@@ -27,8 +33,11 @@ def generate_company() -> bool:
 
     json_schema = json.dumps(Company.model_json_schema())
 
+    # Streaming asks for spare rows and cancels the stream once the batch is stored
+    count = BATCH_SIZE + STREAM_EXTRA_ROWS if stream else BATCH_SIZE
+
     user_prompt = (
-        f"Generate 5 unique Company profiles. "
+        f"Generate {count} unique Company profiles. "
         f"Use the following JSON schema to generate Company profile: <json_schema>{json_schema}</json_schema>. "
         "Do not use <company_id> or <company_name> that are present in the database. "
         f"Here is the list of companies in the current database: <database_data>{present_companies}</database_data>. "
@@ -44,32 +53,39 @@ def generate_company() -> bool:
         },
     )
 
-    try:
-        console.print("Waiting for AI to generate company data...")
-        result = agent.run_sync(user_prompt=user_prompt)
-    except Exception as error:
-        console.print(error)
-        return False
-
-    new, dup = 0, 0
+    policy = request_policy()
+    success = True
     with Session(DB_ENGINE) as session:
-        random_addresses = session.exec(select(Address).order_by(func.random()).limit(2)).all()
-
-        for company in result.data:
-            company.address_billing_id = random_addresses[0].id
-            company.address_shipping_id = random_addresses[1].id
-
-            session.add(company)
-            try:
-                session.commit()
-                new += 1
-            except IntegrityError:
-                session.rollback()
-                dup += 1
-
-    console.print(f"New companies: {new}, duplicate companies: {dup}")
+        random_addresses = session.exec(select(Address.id).order_by(func.random()).limit(2)).all()
+        insert = RowInserter(session, NearDuplicateIndex(session, Company))
+
+        def store(company: Company) -> bool:
+            company.address_billing_id = random_addresses[0]
+            company.address_shipping_id = random_addresses[1]
+            return insert(company)
+
+        try:
+            if stream:
+                console.print("Streaming AI generated company data...")
+                stream_rows(agent, user_prompt, store, BATCH_SIZE, policy.deadline)
+            else:
+                console.print("Waiting for AI to generate company data...")
+                rows = policy.run(agent, user_prompt)
+                for company in rows:
+                    store(company)
+        except Exception as error:
+            console.print(error)
+            success = False
+
+        record_rows(session, Company, insert.new)
+        session.commit()
+
+    console.print(
+        f"New companies: {insert.new}, duplicate companies: {insert.dup}, "
+        f"near-duplicate companies: {insert.near}"
+    )
 
-    return True
+    return success
 
 
 def list_companies():
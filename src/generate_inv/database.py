@@ -1,15 +1,65 @@
+from pathlib import Path
+from typing import TYPE_CHECKING
+
 from sqlalchemy import MetaData, Table, inspect
-from sqlalchemy.exc import NoSuchTableError
+from sqlalchemy.exc import IntegrityError, NoSuchTableError
 from sqlalchemy.schema import CreateTable
-from sqlmodel import Session, create_engine, func, select
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from . import DB_FILE, console, package_name
 
-from . import DB_FILE, console
+if TYPE_CHECKING:
+    from .dedup import NearDuplicateIndex
 
 DB_ENGINE = create_engine(f"sqlite:///{DB_FILE}", echo=False)
 
 
+class RowInserter:
+    """Insert rows one by one and count new, duplicate and near-duplicate rows"""
+
+    def __init__(self, session: Session, index: "NearDuplicateIndex | None" = None) -> None:
+        self.session = session
+        self.index = index
+        self.new = 0
+        self.dup = 0
+        self.near = 0
+
+    def __call__(self, row: SQLModel) -> bool:
+        """Insert row, return False when it is a duplicate or a near-duplicate
+
+        The near-duplicate index is checked before the row is added to the session, so a
+        rejected row is never flushed and rolled back.
+        """
+        if self.index is not None:
+            match = self.index.find(getattr(row, self.index.column))
+            if match is not None:
+                stored = self.session.get(type(row), match)
+                if getattr(stored, self.index.column) == getattr(row, self.index.column):
+                    self.dup += 1
+                else:
+                    self.near += 1
+                return False
+
+        self.session.add(row)
+        try:
+            self.session.flush()
+        except IntegrityError:
+            self.session.rollback()
+            self.dup += 1
+            return False
+
+        if self.index is not None:
+            self.index.add(row)
+        self.session.commit()
+        self.new += 1
+        return True
+
+
 def show_schema() -> None:
     """Show database schema"""
+    from .migrations import schema_version  # noqa: PLC0415, import cycle
+    from .models import SchemaVersion  # noqa: PLC0415, import cycle
+
     inspector = inspect(DB_ENGINE)
     metadata = MetaData()
 
@@ -25,29 +75,263 @@ def show_schema() -> None:
         table_ddl = CreateTable(table).compile(DB_ENGINE)
         console.print(table_ddl)
 
+    if SchemaVersion.__tablename__ in inspector.get_table_names():
+        with DB_ENGINE.connect() as connection:
+            console.print(f"Schema version: {schema_version(connection)}")
+
 
-def show_stats() -> None:
-    """Show database statistics"""
+def show_stats(exact: bool = False) -> None:
+    """Show database statistics
+
+    Args:
+        exact: Recompute statistics instead of reading the incrementally maintained ones.
+            Byte sizes are only measured by a recompute, they show the snapshot time.
+    """
     from rich.table import Table
 
-    from .models import Address, Company, InvoiceItem
+    from .models import create_db_schema
+    from .stats import get_stats  # noqa: PLC0415, import cycle
 
-    with Session(DB_ENGINE) as session:
-        address_count = session.scalar(select(func.count(Address.id)))
-        company_count = session.scalar(select(func.count(Company.id)))
-        invoice_item_count = session.scalar(select(func.count(InvoiceItem.id)))
+    create_db_schema()
+    table_stats, column_stats = get_stats(exact)
 
     table = Table(title="Database Statistics")
 
     table.add_column("Table Name", style="green")
     table.add_column("Records Count", style="yellow")
-    table.add_row("Address", str(address_count))
-    table.add_row("Company", str(company_count))
-    table.add_row("InvoiceItem", str(invoice_item_count))
+    table.add_column("Size Bytes", style="blue")
+    table.add_column("Size Snapshot UTC", style="blue")
+    table.add_column("Distinct Values", style="magenta")
+    table.add_column("Updated UTC", style="cyan")
+
+    for item in table_stats:
+        distinct = ", ".join(
+            f"{column.column_name}={column.distinct_count}"
+            for column in column_stats
+            if column.table_name == item.table_name
+        )
+        table.add_row(
+            item.table_name,
+            str(item.row_count),
+            "" if item.byte_size is None else str(item.byte_size),
+            "" if item.refreshed_at is None else item.refreshed_at.strftime("%Y-%m-%d %H:%M:%S"),
+            distinct,
+            item.updated_at.strftime("%Y-%m-%d %H:%M:%S"),
+        )
 
     with console.pager(styles=True):
         console.print(table)
 
 
+def merge_databases(db_files: list[Path]) -> None:
+    """Merge shard databases into the current database
+
+    Rows are deduplicated on their unique keys, and jobs on their creation time and
+    parameters. Jobs are copied with their units, invoice records, invoice lines and
+    row snapshots under new job IDs, and all company, address and invoice item foreign
+    keys are remapped to the IDs of the current database.
+    """
+    from .models import Address, Company, InvoiceItem, Job, create_db_schema  # noqa: PLC0415, import cycle
+    from .stats import record_rows  # noqa: PLC0415, import cycle
+
+    create_db_schema()
+
+    for db_file in db_files:
+        if db_file.resolve() == DB_FILE.resolve():
+            console.print(f"Skipping {db_file}, it is the current database", style="yellow")
+            continue
+
+        source_engine = create_engine(f"sqlite:///{db_file}", echo=False)
+
+        source_tables = set(inspect(source_engine).get_table_names())
+        required_tables = {Address.__tablename__, Company.__tablename__, InvoiceItem.__tablename__}
+        if not required_tables <= source_tables:
+            console.print(f"Skipping {db_file}, it is not a {package_name} database", style="red")
+            source_engine.dispose()
+            continue
+
+        with Session(source_engine) as source, Session(DB_ENGINE) as target:
+            address_map, new, dup = _merge_addresses(source, target)
+            record_rows(target, Address, new)
+            console.print(f"{db_file}: new addresses: {new}, duplicate addresses: {dup}")
+
+            company_map, new, dup = _merge_companies(source, target, address_map)
+            record_rows(target, Company, new)
+            console.print(f"{db_file}: new companies: {new}, duplicate companies: {dup}")
+
+            item_map, new, dup = _merge_invoice_items(source, target)
+            record_rows(target, InvoiceItem, new)
+            console.print(f"{db_file}: new invoice items: {new}, duplicate invoice items: {dup}")
+
+            # Shards written before jobs were tracked have no job tables
+            if Job.__tablename__ in source_tables:
+                row_maps = {
+                    Address.__tablename__: address_map,
+                    Company.__tablename__: company_map,
+                    InvoiceItem.__tablename__: item_map,
+                }
+                new, dup, invoices = _merge_jobs(source, target, row_maps)
+                console.print(
+                    f"{db_file}: new jobs: {new}, duplicate jobs: {dup}, new invoices: {invoices}"
+                )
+
+            target.commit()
+
+        source_engine.dispose()
+
+
+def _merge_addresses(source: Session, target: Session) -> tuple[dict[int, int], int, int]:
+    """Copy new addresses, return source to target address ID map"""
+    from .models import Address  # noqa: PLC0415, import cycle
+
+    address_ids = dict(target.exec(select(Address.address_line1, Address.id)).all())
+    address_map: dict[int, int] = {}
+    new, dup = 0, 0
+    for address in source.exec(select(Address).order_by(Address.id)).all():
+        if address.address_line1 in address_ids:
+            address_map[address.id] = address_ids[address.address_line1]
+            dup += 1
+            continue
+        row = Address.model_validate(address.model_dump(exclude={"id"}))
+        target.add(row)
+        target.flush()
+        address_ids[row.address_line1] = address_map[address.id] = row.id
+        new += 1
+
+    return address_map, new, dup
+
+
+def _merge_companies(
+    source: Session, target: Session, address_map: dict[int, int]
+) -> tuple[dict[int, int], int, int]:
+    """Copy new companies with remapped address foreign keys, return company ID map"""
+    from .models import Company  # noqa: PLC0415, import cycle
+
+    company_ids = {}
+    for company_id, company_name, row_id in target.exec(
+        select(Company.company_id, Company.company_name, Company.id)
+    ).all():
+        company_ids[company_id] = company_ids[company_name] = row_id
+
+    company_map: dict[int, int] = {}
+    new, dup = 0, 0
+    for company in source.exec(select(Company).order_by(Company.id)).all():
+        match = company_ids.get(company.company_id, company_ids.get(company.company_name))
+        if match is not None:
+            company_map[company.id] = match
+            dup += 1
+            continue
+        row = Company.model_validate(company.model_dump(exclude={"id"}))
+        row.address_billing_id = address_map.get(company.address_billing_id)
+        row.address_shipping_id = address_map.get(company.address_shipping_id)
+        target.add(row)
+        target.flush()
+        company_ids[row.company_id] = company_ids[row.company_name] = row.id
+        company_map[company.id] = row.id
+        new += 1
+
+    return company_map, new, dup
+
+
+def _merge_invoice_items(source: Session, target: Session) -> tuple[dict[int, int], int, int]:
+    """Copy new invoice items, return invoice item ID map"""
+    from .models import InvoiceItem  # noqa: PLC0415, import cycle
+
+    item_ids = {}
+    for item_sku, item_info, row_id in target.exec(
+        select(InvoiceItem.item_sku, InvoiceItem.item_info, InvoiceItem.id)
+    ).all():
+        item_ids[item_sku] = item_ids[item_info] = row_id
+
+    item_map: dict[int, int] = {}
+    new, dup = 0, 0
+    for item in source.exec(select(InvoiceItem).order_by(InvoiceItem.id)).all():
+        match = item_ids.get(item.item_sku, item_ids.get(item.item_info))
+        if match is not None:
+            item_map[item.id] = match
+            dup += 1
+            continue
+        row = InvoiceItem.model_validate(item.model_dump(exclude={"id"}))
+        target.add(row)
+        target.flush()
+        item_ids[row.item_sku] = item_ids[row.item_info] = item_map[item.id] = row.id
+        new += 1
+
+    return item_map, new, dup
+
+
+def _merge_jobs(
+    source: Session, target: Session, row_maps: dict[str, dict[int, int]]
+) -> tuple[int, int, int]:
+    """Copy new jobs with their rows under new job IDs, return job and invoice counts
+
+    `row_maps` maps source to target row IDs per table name.
+    """
+    from .models import (  # noqa: PLC0415, import cycle
+        Address,
+        Company,
+        InvoiceItem,
+        InvoiceLine,
+        InvoiceRecord,
+        Job,
+        JobUnit,
+        RowSnapshot,
+    )
+
+    address_map = row_maps[Address.__tablename__]
+    company_map = row_maps[Company.__tablename__]
+    item_map = row_maps[InvoiceItem.__tablename__]
+    job_keys = set(target.exec(select(Job.created_at, Job.params)).all())
+
+    new, dup, invoices = 0, 0, 0
+    for job in source.exec(select(Job).order_by(Job.id)).all():
+        if (job.created_at, job.params) in job_keys:
+            dup += 1
+            continue
+        row = Job.model_validate(job.model_dump(exclude={"id"}))
+        target.add(row)
+        target.flush()
+        job_keys.add((row.created_at, row.params))
+        new += 1
+
+        for unit in source.exec(select(JobUnit).where(JobUnit.job_id == job.id)).all():
+            target.add(JobUnit.model_validate(unit.model_dump() | {"job_id": row.id}))
+
+        records = source.exec(select(InvoiceRecord).where(InvoiceRecord.job_id == job.id)).all()
+        for record in records:
+            values = record.model_dump() | {
+                "job_id": row.id,
+                "supplier_id": company_map[record.supplier_id],
+                "customer_id": company_map[record.customer_id],
+            }
+            for column in (
+                "supplier_billing_address_id",
+                "supplier_shipping_address_id",
+                "customer_billing_address_id",
+                "customer_shipping_address_id",
+            ):
+                values[column] = address_map.get(values[column])
+            target.add(InvoiceRecord.model_validate(values))
+            invoices += 1
+
+        lines = source.exec(select(InvoiceLine).where(InvoiceLine.job_id == job.id)).all()
+        for line in lines:
+            values = line.model_dump() | {"job_id": row.id, "item_id": item_map[line.item_id]}
+            target.add(InvoiceLine.model_validate(values))
+
+        snapshots = source.exec(select(RowSnapshot).where(RowSnapshot.job_id == job.id)).all()
+        snapshot_keys = set()
+        for snapshot in snapshots:
+            row_id = row_maps[snapshot.table_name][snapshot.row_id]
+            # Duplicate source rows can map to the same target row
+            if (snapshot.table_name, row_id) in snapshot_keys:
+                continue
+            snapshot_keys.add((snapshot.table_name, row_id))
+            values = snapshot.model_dump() | {"job_id": row.id, "row_id": row_id}
+            target.add(RowSnapshot.model_validate(values))
+
+    return new, dup, invoices
+
+
 if __name__ == "__main__":
     show_schema()
@@ -0,0 +1,134 @@
+"""Near-duplicate detection with a persistent MinHash/LSH index"""
+
+import hashlib
+import re
+import struct
+from random import Random
+
+from sqlmodel import Session, SQLModel, func, select
+
+from .models import Address, Company, InvoiceItem, LshBucket, MinHashSignature
+
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 3
+NEAR_DUP_THRESHOLD = 0.7
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+NEAR_DUP_COLUMNS: dict[type[SQLModel], str] = {
+    Address: "address_line1",
+    Company: "company_name",
+    InvoiceItem: "item_info",
+}
+
+# Fixed permutations, signatures stay comparable across processes and databases
+_random = Random(NUM_PERM)
+PERMUTATIONS = [
+    (_random.randrange(1, MERSENNE_PRIME), _random.randrange(0, MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+
+def shingles(text: str) -> set[bytes]:
+    """Character shingles of the normalized text"""
+    words = re.sub(r"[^0-9a-z]+", " ", text.lower()).split()
+    normalized = " ".join(words)
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized.encode()}
+    return {
+        normalized[start : start + SHINGLE_SIZE].encode()
+        for start in range(len(normalized) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash(text: str) -> list[int]:
+    """MinHash signature of the text"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle, digest_size=4).digest())
+        for shingle in shingles(text)
+    ]
+    return [
+        min(((a * value + b) % MERSENNE_PRIME) & MAX_HASH for value in hashes)
+        for a, b in PERMUTATIONS
+    ]
+
+
+def lsh_buckets(signature: list[int]) -> list[int]:
+    """One bucket hash per signature band, as signed 64-bit SQLite integers"""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS : (band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(struct.pack(f"<I{LSH_ROWS}I", band, *rows), digest_size=8)
+        buckets.append(int.from_bytes(digest.digest(), signed=True))
+    return buckets
+
+
+def similarity(signature: list[int], other: list[int]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(a == b for a, b in zip(signature, other, strict=True)) / NUM_PERM
+
+
+def pack_signature(signature: list[int]) -> bytes:
+    return struct.pack(f"<{NUM_PERM}I", *signature)
+
+
+def unpack_signature(data: bytes) -> list[int]:
+    return list(struct.unpack(f"<{NUM_PERM}I", data))
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index over the near-duplicate column of one table
+
+    A lookup reads only the rows that share an LSH band with the new value, so the
+    check does not grow with the table size. Rows inserted by other code paths, like
+    database merges, are indexed when the index is opened.
+    """
+
+    def __init__(self, session: Session, model: type[SQLModel]) -> None:
+        self.session = session
+        self.model = model
+        self.table_name = model.__tablename__
+        self.column = NEAR_DUP_COLUMNS[model]
+        self._backfill()
+
+    def find(self, text: str, threshold: float = NEAR_DUP_THRESHOLD) -> int | None:
+        """Return ID of an indexed row similar to the text"""
+        signature = minhash(text)
+        candidates = select(LshBucket.row_id).where(
+            LshBucket.table_name == self.table_name,
+            LshBucket.bucket.in_(lsh_buckets(signature)),
+        )
+        statement = select(MinHashSignature).where(
+            MinHashSignature.table_name == self.table_name,
+            MinHashSignature.row_id.in_(candidates),
+        )
+        for candidate in self.session.exec(statement):
+            if similarity(signature, unpack_signature(candidate.signature)) >= threshold:
+                return candidate.row_id
+        return None
+
+    def add(self, row: SQLModel) -> None:
+        """Index a flushed row in the caller transaction"""
+        signature = minhash(getattr(row, self.column))
+        self.session.add(
+            MinHashSignature(
+                table_name=self.table_name, row_id=row.id, signature=pack_signature(signature)
+            )
+        )
+        for bucket in set(lsh_buckets(signature)):
+            self.session.add(LshBucket(table_name=self.table_name, bucket=bucket, row_id=row.id))
+
+    def _backfill(self) -> None:
+        indexed = self.session.exec(
+            select(func.max(MinHashSignature.row_id)).where(
+                MinHashSignature.table_name == self.table_name
+            )
+        ).one()
+        statement = select(self.model).where(self.model.id > (indexed or 0))
+        rows = self.session.exec(statement).all()
+        for row in rows:
+            self.add(row)
+        if rows:
+            self.session.commit()
@@ -0,0 +1,258 @@
+"""Source rows and template of stored invoices, to find invoices to re-render
+
+Every invoice record keeps the template hash and the address IDs it was rendered
+with, the invoice lines keep the item IDs. The content hash of every source row an
+invoice references is snapshot when the invoice is stored, as of the start of the
+run that rendered it. A row whose hash differs from the snapshot, or that was
+deleted, marks its invoices as changed.
+"""
+
+import hashlib
+import json
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+from itertools import batched
+
+from sqlmodel import Session, SQLModel, or_, select
+
+from .database import DB_ENGINE
+from .models import Address, Company, Invoice, InvoiceItem, InvoiceLine, InvoiceRecord, RowSnapshot
+
+# Stored invoices are loaded for re-rendering in chunks of this many
+LOAD_CHUNK = 500
+
+SOURCE_MODELS: list[type[SQLModel]] = [Address, Company, InvoiceItem]
+
+SourceRows = dict[str, dict[int, SQLModel]]
+RowHashes = dict[str, dict[int, str]]
+
+
+def row_hash(row: SQLModel) -> str:
+    """Content hash of a table row
+
+    Keys are sorted, the attribute order of a loaded row depends on the query.
+    """
+    content = json.dumps(row.model_dump(mode="json"), sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def source_rows(session: Session) -> SourceRows:
+    """Current addresses, companies and invoice items by table name and row ID"""
+    return {
+        model.__tablename__: {row.id: row for row in session.exec(select(model))}
+        for model in SOURCE_MODELS
+    }
+
+
+def row_hashes(rows: SourceRows) -> RowHashes:
+    """Content hashes of source rows
+
+    Hash rows before they are used in invoices, invoice validation recomputes
+    item totals in place.
+    """
+    return {
+        table_name: {row_id: row_hash(row) for row_id, row in table_rows.items()}
+        for table_name, table_rows in rows.items()
+    }
+
+
+def referenced_rows(rows: Iterable[InvoiceRecord | InvoiceLine]) -> Iterator[tuple[str, int]]:
+    """(table name, row ID) of the source rows invoice records and lines reference"""
+    for row in rows:
+        if isinstance(row, InvoiceLine):
+            yield InvoiceItem.__tablename__, row.item_id
+            continue
+        yield Company.__tablename__, row.supplier_id
+        yield Company.__tablename__, row.customer_id
+        for address_id in (
+            row.supplier_billing_address_id,
+            row.supplier_shipping_address_id,
+            row.customer_billing_address_id,
+            row.customer_shipping_address_id,
+        ):
+            if address_id is not None:
+                yield Address.__tablename__, address_id
+
+
+class SnapshotRecorder:
+    """Add hashes of the source rows stored invoices reference to the job snapshot
+
+    Existing hashes are kept, so a resumed job still compares against the rows
+    its first invoices were rendered from. Snapshots are added to the session of
+    the invoice rows and committed with them.
+    """
+
+    def __init__(self, session: Session, job_id: int, hashes: RowHashes) -> None:
+        self.session = session
+        self.job_id = job_id
+        self.hashes = hashes
+        statement = select(RowSnapshot.table_name, RowSnapshot.row_id).where(
+            RowSnapshot.job_id == job_id
+        )
+        self.known: set[tuple[str, int]] = set(session.exec(statement).all())
+
+    def add(self, rows: Iterable[InvoiceRecord | InvoiceLine]) -> None:
+        for table_name, row_id in referenced_rows(rows):
+            hash_ = self.hashes[table_name].get(row_id)
+            if hash_ is None or (table_name, row_id) in self.known:
+                continue
+            self.known.add((table_name, row_id))
+            self.session.add(
+                RowSnapshot(
+                    job_id=self.job_id, table_name=table_name, row_id=row_id, row_hash=hash_
+                )
+            )
+
+
+def changed_rows(session: Session, job_id: int, hashes: RowHashes) -> dict[str, set[int]] | None:
+    """Source rows changed or deleted since the job snapshot, None without a snapshot"""
+    snapshots = session.exec(select(RowSnapshot).where(RowSnapshot.job_id == job_id)).all()
+    if not snapshots:
+        return None
+
+    changed: dict[str, set[int]] = {model.__tablename__: set() for model in SOURCE_MODELS}
+    for snapshot in snapshots:
+        if hashes[snapshot.table_name].get(snapshot.row_id) != snapshot.row_hash:
+            changed[snapshot.table_name].add(snapshot.row_id)
+    return changed
+
+
+def update_snapshot(
+    session: Session, job_id: int, hashes: RowHashes, changed: dict[str, set[int]]
+) -> None:
+    """Store current hashes of changed rows, forget deleted rows"""
+    for table_name, row_ids in changed.items():
+        for row_id in row_ids:
+            snapshot = session.get(RowSnapshot, (job_id, table_name, row_id))
+            if row_id not in hashes[table_name]:
+                session.delete(snapshot)
+            else:
+                snapshot.row_hash = hashes[table_name][row_id]
+                session.add(snapshot)
+    session.commit()
+
+
+def affected_sequences(
+    session: Session, job_id: int, changed: dict[str, set[int]] | None, template: str
+) -> list[int]:
+    """Sequences of stored invoices rendered from another template or from changed rows
+
+    Without a snapshot, every invoice of the job is affected.
+    """
+    statement = select(InvoiceRecord.sequence).where(InvoiceRecord.job_id == job_id)
+    if changed is None:
+        return sorted(session.exec(statement).all())
+
+    addresses = changed[Address.__tablename__]
+    companies = changed[Company.__tablename__]
+    statement = statement.where(
+        or_(
+            InvoiceRecord.template_hash != template,
+            InvoiceRecord.supplier_id.in_(companies),
+            InvoiceRecord.customer_id.in_(companies),
+            InvoiceRecord.supplier_billing_address_id.in_(addresses),
+            InvoiceRecord.supplier_shipping_address_id.in_(addresses),
+            InvoiceRecord.customer_billing_address_id.in_(addresses),
+            InvoiceRecord.customer_shipping_address_id.in_(addresses),
+        )
+    )
+    sequences = set(session.exec(statement).all())
+
+    statement = select(InvoiceLine.sequence).where(
+        InvoiceLine.job_id == job_id,
+        InvoiceLine.item_id.in_(changed[InvoiceItem.__tablename__]),
+    )
+    sequences.update(session.exec(statement).all())
+    return sorted(sequences)
+
+
+def stored_invoice(
+    record: InvoiceRecord, lines: list[InvoiceLine], rows: SourceRows
+) -> Invoice | None:
+    """Rebuild a stored invoice from the current source rows, None when one was deleted
+
+    The invoice keeps the addresses it was rendered with, even when its companies
+    moved to other addresses since. Records from before dependency tracking have no
+    template hash and no address IDs, they use the current company addresses.
+    """
+    companies = rows[Company.__tablename__]
+    items = rows[InvoiceItem.__tablename__]
+    addresses = rows[Address.__tablename__]
+
+    supplier = companies.get(record.supplier_id)
+    customer = companies.get(record.customer_id)
+    line_items = [items.get(line.item_id) for line in lines]
+    if supplier is None or customer is None or None in line_items:
+        return None
+    if record.template_hash:
+        supplier = supplier.model_copy(
+            update={
+                "address_billing_id": record.supplier_billing_address_id,
+                "address_shipping_id": record.supplier_shipping_address_id,
+            }
+        )
+        customer = customer.model_copy(
+            update={
+                "address_billing_id": record.customer_billing_address_id,
+                "address_shipping_id": record.customer_shipping_address_id,
+            }
+        )
+    address_ids = (
+        supplier.address_billing_id,
+        supplier.address_shipping_id,
+        customer.address_billing_id,
+        customer.address_shipping_id,
+    )
+    if any(address_id is not None and address_id not in addresses for address_id in address_ids):
+        return None
+
+    issue_date = datetime.combine(record.issue_date, datetime.min.time())
+    payment_terms = (record.due_date - record.issue_date).days
+    return Invoice(
+        invoice_number=record.invoice_number,
+        issue_date=issue_date,
+        payment_terms=payment_terms,
+        due_date=issue_date + timedelta(days=payment_terms),
+        supplier=supplier,
+        customer=customer,
+        line_items=line_items,
+        currency=record.currency,
+    )
+
+
+def stored_invoices(
+    job_id: int,
+    sequences: list[int],
+    rows: SourceRows,
+    loaded: dict[int, Invoice],
+    skipped: list[int],
+) -> Iterator[tuple[int, Invoice]]:
+    """Rebuild stored invoices of a job chunk by chunk, yield them with their sequence
+
+    Yielded invoices are also kept in `loaded` until the caller pops them, sequences
+    of invoices with deleted source rows are appended to `skipped`.
+    """
+    for chunk in batched(sequences, LOAD_CHUNK):
+        # A short session per chunk, so no read lock is held while rendering
+        with Session(DB_ENGINE) as session:
+            records = session.exec(
+                select(InvoiceRecord).where(
+                    InvoiceRecord.job_id == job_id, InvoiceRecord.sequence.in_(chunk)
+                )
+            ).all()
+            lines = session.exec(
+                select(InvoiceLine)
+                .where(InvoiceLine.job_id == job_id, InvoiceLine.sequence.in_(chunk))
+                .order_by(InvoiceLine.sequence, InvoiceLine.line)
+            ).all()
+
+        lines_by_sequence: dict[int, list[InvoiceLine]] = {}
+        for line in lines:
+            lines_by_sequence.setdefault(line.sequence, []).append(line)
+        for record in records:
+            invoice = stored_invoice(record, lines_by_sequence.get(record.sequence, []), rows)
+            if invoice is None:
+                skipped.append(record.sequence)
+                continue
+            loaded[record.sequence] = invoice
+            yield record.sequence, invoice
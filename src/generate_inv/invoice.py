@@ -1,15 +1,38 @@
 """Generate synthetic invoice data"""
 
+import hashlib
+import io
+import multiprocessing
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache, partial
+from itertools import batched, count
 from pathlib import Path
 from random import randint
 
 from sqlmodel import Session, func, select
 
 # from . import console
-from .company import Company
 from .database import DB_ENGINE
-from .invoice_item import InvoiceItem
-from .models import Address, Invoice
+from .models import Address, Company, Invoice, InvoiceItem
+from .scenario import Scenario, ScenarioConfig
+from .types import DocumentFormat, PdfOptimize
+
+PNG_DPI = 150
+RENDER_QUEUE_PER_WORKER = 4
+
+# WeasyPrint render options per optimization level, fonts are subset unless full_fonts.
+# Images are optimized when the document is laid out, not when the PDF is written.
+PDF_OPTIONS: dict[PdfOptimize, dict] = {
+    PdfOptimize.OFF: {},
+    PdfOptimize.SIZE: {"optimize_images": True, "jpeg_quality": 80, "dpi": 150},
+    PdfOptimize.MAX: {"optimize_images": True, "jpeg_quality": 80, "dpi": 150},
+}
+
+# Images, like the template logo, are fetched and decoded once per process and
+# optimization level, cached images already carry the options of their level
+_image_caches: dict[PdfOptimize, dict] = {optimize: {} for optimize in PdfOptimize}
 
 
 def generate_invoice() -> Invoice:
@@ -33,22 +56,94 @@ def generate_invoice() -> Invoice:
     return invoice
 
 
-def write_invoice(invoice: Invoice) -> bytes:
-    """Create an invoice PDF"""
+class RenderedInvoice:
+    """Invoice rendered once, exported to any number of document formats"""
+
+    def __init__(
+        self, invoice_number: str, html: str, document, optimize: PdfOptimize = PdfOptimize.OFF
+    ) -> None:
+        self.invoice_number = invoice_number
+        self.html = html
+        self.document = document
+        self.optimize = optimize
+        self._pdf: bytes | None = None
+
+    def pdf(self) -> bytes:
+        if self._pdf is None:
+            self._pdf = self.document.write_pdf()
+            if self.optimize == PdfOptimize.MAX:
+                self._pdf = compress_pdf(self._pdf)
+        return self._pdf
+
+    def png_pages(self, dpi: int = PNG_DPI) -> list[bytes]:
+        """Rasterize the PDF pages, requires the optional `pypdfium2` package"""
+        try:
+            import pypdfium2  # noqa: PLC0415, optional dependency
+        except ImportError:
+            raise RuntimeError(
+                "PNG output requires pypdfium2, install it with `pip install generate-inv[png]`"
+            ) from None
+
+        pages = []
+        pdf = pypdfium2.PdfDocument(self.pdf())
+        for page in pdf:
+            image = page.render(scale=dpi / 72).to_pil()
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            pages.append(buffer.getvalue())
+        pdf.close()
+
+        return pages
 
+    def documents(self, formats: list[DocumentFormat]) -> list[tuple[str, bytes]]:
+        """Return (file name, content) for every requested format"""
+        documents = []
+        if DocumentFormat.PDF in formats:
+            documents.append((f"{self.invoice_number}.pdf", self.pdf()))
+        if DocumentFormat.HTML in formats:
+            documents.append((f"{self.invoice_number}.html", self.html.encode()))
+        if DocumentFormat.PNG in formats:
+            for page, png_bytes in enumerate(self.png_pages(), start=1):
+                documents.append((f"{self.invoice_number}-page{page}.png", png_bytes))
+        return documents
+
+
+@cache
+def _template():
     from jinja2 import Environment, FileSystemLoader
-    from weasyprint import HTML
 
     template_dir = Path(__file__).parent
-    template = Environment(loader=FileSystemLoader(template_dir)).get_template("invoice.j2")
+    return Environment(loader=FileSystemLoader(template_dir)).get_template("invoice.j2")
 
-    with Session(DB_ENGINE) as session:
-        supplier_address_billing = session.get(Address, invoice.supplier.address_billing_id)
-        supplier_address_shipping = session.get(Address, invoice.supplier.address_shipping_id)
-        customer_address_billing = session.get(Address, invoice.customer.address_billing_id)
-        customer_address_shipping = session.get(Address, invoice.customer.address_shipping_id)
 
-    html_content = template.render(
+@cache
+def template_hash() -> str:
+    """Hash of the invoice template, stored with every rendered invoice"""
+    template = Path(__file__).parent.joinpath("invoice.j2").read_bytes()
+    return hashlib.sha256(template).hexdigest()[:16]
+
+
+def render_html(invoice: Invoice, addresses: dict[int, Address] | None = None) -> str:
+    """Render invoice HTML
+
+    Args:
+        invoice: Invoice to render
+        addresses: Preloaded addresses by ID, skips the per-invoice address lookups
+    """
+
+    if addresses is not None:
+        supplier_address_billing = addresses.get(invoice.supplier.address_billing_id)
+        supplier_address_shipping = addresses.get(invoice.supplier.address_shipping_id)
+        customer_address_billing = addresses.get(invoice.customer.address_billing_id)
+        customer_address_shipping = addresses.get(invoice.customer.address_shipping_id)
+    else:
+        with Session(DB_ENGINE) as session:
+            supplier_address_billing = session.get(Address, invoice.supplier.address_billing_id)
+            supplier_address_shipping = session.get(Address, invoice.supplier.address_shipping_id)
+            customer_address_billing = session.get(Address, invoice.customer.address_billing_id)
+            customer_address_shipping = session.get(Address, invoice.customer.address_shipping_id)
+
+    return _template().render(
         invoice_number=invoice.invoice_number,
         issue_date=invoice.issue_date.strftime("%Y-%m-%d"),
         due_date=invoice.due_date.strftime("%Y-%m-%d"),
@@ -66,9 +161,247 @@ def write_invoice(invoice: Invoice) -> bytes:
         total=invoice.total_formatted,
     )
 
-    pdf_bytes = HTML(string=html_content).write_pdf()
 
-    return pdf_bytes
+def compress_pdf(pdf: bytes) -> bytes:
+    """Recompress PDF streams and pack objects into object streams
+
+    Requires the optional `pikepdf` package.
+    """
+    try:
+        import pikepdf  # noqa: PLC0415, optional dependency
+    except ImportError:
+        raise RuntimeError(
+            "PDF post-compression requires pikepdf, "
+            "install it with `pip install generate-inv[pdf-optimize]`"
+        ) from None
+
+    buffer = io.BytesIO()
+    with pikepdf.open(io.BytesIO(pdf)) as document:
+        document.remove_unreferenced_resources()
+        document.save(
+            buffer,
+            compress_streams=True,
+            recompress_flate=True,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+        )
+    compressed = buffer.getvalue()
+
+    return compressed if len(compressed) < len(pdf) else pdf
+
+
+def layout_html(html_content: str, optimize: PdfOptimize = PdfOptimize.OFF):
+    """Lay out HTML with WeasyPrint, images are optimized for the given level"""
+    from weasyprint import HTML
+
+    options = PDF_OPTIONS[optimize]
+    return HTML(string=html_content).render(cache=_image_caches[optimize], **options)
+
+
+def render_invoice(
+    invoice: Invoice,
+    addresses: dict[int, Address] | None = None,
+    formats: list[DocumentFormat] | None = None,
+    optimize: PdfOptimize = PdfOptimize.OFF,
+) -> RenderedInvoice:
+    """Render invoice HTML and lay it out once
+
+    The WeasyPrint layout is skipped when only HTML output is requested.
+    """
+    html_content = render_html(invoice, addresses)
+
+    document = None
+    if formats is None or set(formats) - {DocumentFormat.HTML}:
+        document = layout_html(html_content, optimize)
+
+    return RenderedInvoice(invoice.invoice_number, html_content, document, optimize)
+
+
+def write_invoice(
+    invoice: Invoice,
+    addresses: dict[int, Address] | None = None,
+    optimize: PdfOptimize = PdfOptimize.OFF,
+) -> bytes:
+    """Create an invoice PDF"""
+    return render_invoice(invoice, addresses, optimize=optimize).pdf()
+
+
+class _RenderWorker:
+    """State of a render worker process, set once by the pool initializer"""
+
+    def __init__(self) -> None:
+        self.scenario: Scenario | None = None
+        self.addresses: dict[int, Address] = {}
+        self.optimize = PdfOptimize.OFF
+
+
+_worker = _RenderWorker()
+
+RenderedDocuments = tuple[int, str, list[tuple[str, bytes]]]
+
+
+def init_render_worker(config_json: str, optimize: PdfOptimize = PdfOptimize.OFF) -> None:
+    """Process pool initializer, builds the scenario tables of the worker once"""
+    _worker.scenario = Scenario(ScenarioConfig.model_validate_json(config_json))
+    _worker.optimize = optimize
+
+
+def _init_address_worker(optimize: PdfOptimize = PdfOptimize.OFF) -> None:
+    with Session(DB_ENGINE) as session:
+        _worker.addresses = {address.id: address for address in session.exec(select(Address))}
+    _worker.optimize = optimize
+
+
+def render_sequence(sequence: int, formats: list[DocumentFormat]) -> RenderedDocuments:
+    """Sample and render one invoice in a worker set up by `init_render_worker`"""
+    invoice = _worker.scenario.sample(sequence)
+    rendered = render_invoice(invoice, _worker.scenario.addresses, formats, _worker.optimize)
+    return sequence, invoice.invoice_number, rendered.documents(formats)
+
+
+def _render_chunk(
+    sequences: tuple[int, ...], formats: list[DocumentFormat]
+) -> list[RenderedDocuments]:
+    return [render_sequence(sequence, formats) for sequence in sequences]
+
+
+def _render_invoice_chunk(
+    invoices: tuple[tuple[int, Invoice], ...], formats: list[DocumentFormat]
+) -> list[RenderedDocuments]:
+    rendered = []
+    for sequence, invoice in invoices:
+        documents = render_invoice(invoice, _worker.addresses, formats, _worker.optimize)
+        rendered.append((sequence, invoice.invoice_number, documents.documents(formats)))
+    return rendered
+
+
+def _render_in_pool(
+    initializer: Callable[[], None],
+    render_chunk: Callable[[tuple], list[RenderedDocuments]],
+    items: Iterable,
+    workers: int,
+    batch: int,
+) -> Iterator[RenderedDocuments]:
+    """Render chunks of `batch` items in a process pool, yield documents in input order
+
+    At most a few tasks per worker are in flight, so memory stays flat for any
+    number of items. Workers are spawned, not forked, so they share no database
+    connections or threads with the caller. Closing the generator early cancels the
+    tasks the pool has not started yet.
+    """
+    if workers <= 1:
+        initializer()
+        for chunk in batched(items, batch):
+            yield from render_chunk(chunk)
+        return
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+    )
+    try:
+        pending = deque()
+        for chunk in batched(items, batch):
+            pending.append(executor.submit(render_chunk, chunk))
+            if len(pending) >= workers * RENDER_QUEUE_PER_WORKER:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # On an early close, only chunks already handed to the workers are rendered
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def render_sequences(  # noqa: PLR0913, pool options are keyword-only
+    config: ScenarioConfig,
+    sequences: Iterable[int],
+    formats: list[DocumentFormat],
+    *,
+    workers: int = 1,
+    batch: int = 1,
+    optimize: PdfOptimize = PdfOptimize.OFF,
+) -> Iterator[RenderedDocuments]:
+    """Sample and render invoices in a process pool, yield documents in sequence order
+
+    Every worker builds its own scenario tables once. Each task renders `batch`
+    invoices.
+    """
+    initializer = partial(init_render_worker, config.model_dump_json(), optimize)
+    render_chunk = partial(_render_chunk, formats=formats)
+    yield from _render_in_pool(initializer, render_chunk, sequences, workers, batch)
+
+
+def render_invoices(
+    invoices: Iterable[tuple[int, Invoice]],
+    formats: list[DocumentFormat],
+    *,
+    workers: int = 1,
+    batch: int = 1,
+    optimize: PdfOptimize = PdfOptimize.OFF,
+) -> Iterator[RenderedDocuments]:
+    """Render (sequence, invoice) pairs in a process pool, yield documents in input order
+
+    Every worker loads the addresses once.
+    """
+    initializer = partial(_init_address_worker, optimize)
+    render_chunk = partial(_render_invoice_chunk, formats=formats)
+    yield from _render_in_pool(initializer, render_chunk, invoices, workers, batch)
+
+
+def iter_invoices(  # noqa: PLR0913, options are keyword-only
+    n: int | None = None,
+    *,
+    seed: int | None = None,
+    batch: int = 100,
+    formats: list[DocumentFormat] | None = None,
+    workers: int = 1,
+    optimize: PdfOptimize = PdfOptimize.OFF,
+    config: ScenarioConfig | None = None,
+) -> Iterator[Invoice] | Iterator[tuple[Invoice, list[tuple[str, bytes]]]]:
+    """Yield scenario invoices lazily, optionally with rendered documents
+
+    Companies, items and addresses are loaded once, then invoices are sampled a
+    chunk at a time, so memory stays flat for unbounded streams. Invoice `i`
+    depends only on the seed and `i`, like the invoices of `generate-inv invoice`.
+    Render workers are spawned, so scripts using `workers` need an
+    `if __name__ == "__main__":` guard.
+
+    Args:
+        n: Number of invoices, None for an endless stream
+        seed: Random seed, defaults to the scenario seed
+        batch: Invoices sampled ahead, or rendered per worker task
+        formats: Document formats to render, yields (invoice, [(file name, bytes)]) pairs
+        workers: Number of render worker processes
+        optimize: PDF size optimization
+        config: Scenario distribution config
+
+    Example:
+        >>> for invoice in iter_invoices(n=1000, seed=42):
+        ...     feed(invoice.model_dump())
+    """
+    config = config.model_copy() if config else ScenarioConfig()
+    if seed is not None:
+        config.seed = seed
+
+    scenario = Scenario(config)
+    sequences = range(n) if n is not None else count()
+
+    if formats and workers > 1:
+        rendered = render_sequences(
+            config, sequences, formats, workers=workers, batch=batch, optimize=optimize
+        )
+        for sequence, _, documents in rendered:
+            yield scenario.sample(sequence), documents
+        return
+
+    for chunk in batched(sequences, batch):
+        invoices = [scenario.sample(sequence) for sequence in chunk]
+        if not formats:
+            yield from invoices
+            continue
+        for invoice in invoices:
+            rendered = render_invoice(invoice, scenario.addresses, formats, optimize)
+            yield invoice, rendered.documents(formats)
 
 
 if __name__ == "__main__":
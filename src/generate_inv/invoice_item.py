@@ -3,17 +3,23 @@
 import json
 
 from pydantic_ai import Agent
-from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
 
 from . import console
-from .database import DB_ENGINE
+from .database import DB_ENGINE, RowInserter
+from .dedup import NearDuplicateIndex
+from .llm import BATCH_SIZE, STREAM_EXTRA_ROWS, request_policy, stream_rows
 from .models import InvoiceItem
 from .settings import ANTHROPIC_MODEL
+from .stats import record_rows
 
 
-def generate_invoice_items() -> bool:
-    """Generate 5 invoice items and store in database"""
+def generate_invoice_items(stream: bool = False) -> bool:
+    """Generate 5 invoice items and store in database
+
+    Args:
+        stream: Store each item as soon as it is streamed, stop after 5 new items
+    """
 
     with Session(DB_ENGINE) as session:
         statement = select(InvoiceItem.item_sku, InvoiceItem.item_info)
@@ -24,8 +30,11 @@ def generate_invoice_items() -> bool:
         "Your goal in life is to generate unique realistic invoice line items for a computer equipment shop. "
     )
 
+    # Streaming asks for spare rows and cancels the stream once the batch is stored
+    count = BATCH_SIZE + STREAM_EXTRA_ROWS if stream else BATCH_SIZE
+
     user_prompt = (
-        f"Generate 5 unique computer equipment invoice line items. "
+        f"Generate {count} unique computer equipment invoice line items. "
         f"Use JSON schema for each invoice line item: <json_schema>{json.dumps(InvoiceItem.model_json_schema())}</json_schema>. "
         "Do not use item_sku or item_info that are present in the database. "
         f"Here is the list of item_sku and item_info in the current database: <database_data>{present_invoice_items}</database_data>. "
@@ -41,28 +50,32 @@ def generate_invoice_items() -> bool:
         },
     )
 
-    try:
-        console.print("Waiting for AI to generate invoice items...")
-        result = agent.run_sync(user_prompt=user_prompt)
-    except Exception as error:
-        console.print(error)
-        return False
-
-    new, dup = 0, 0
+    policy = request_policy()
+    success = True
     with Session(DB_ENGINE) as session:
-        for item in result.data:
-            session.add(item)
-            try:
-                session.commit()
-                new += 1
-            except IntegrityError:
-                session.rollback()
-                dup += 1
-                continue
-
-    console.print(f"New invoice items: {new}, duplicate invoice items: {dup}")
-
-    return True
+        insert = RowInserter(session, NearDuplicateIndex(session, InvoiceItem))
+        try:
+            if stream:
+                console.print("Streaming AI generated invoice items...")
+                stream_rows(agent, user_prompt, insert, BATCH_SIZE, policy.deadline)
+            else:
+                console.print("Waiting for AI to generate invoice items...")
+                rows = policy.run(agent, user_prompt)
+                for item in rows:
+                    insert(item)
+        except Exception as error:
+            console.print(error)
+            success = False
+
+        record_rows(session, InvoiceItem, insert.new)
+        session.commit()
+
+    console.print(
+        f"New invoice items: {insert.new}, duplicate invoice items: {insert.dup}, "
+        f"near-duplicate invoice items: {insert.near}"
+    )
+
+    return success
 
 
 def list_invoice_items() -> None:
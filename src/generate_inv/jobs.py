@@ -0,0 +1,432 @@
+"""Resumable, checkpointed generation jobs"""
+
+import json
+from collections.abc import Callable, Iterable
+from datetime import UTC, datetime
+from pathlib import Path
+
+from rich.table import Table
+from sqlmodel import Session, delete, func, select
+from typer import BadParameter
+
+from . import console
+from .database import DB_ENGINE
+from .dependencies import (
+    SnapshotRecorder,
+    affected_sequences,
+    changed_rows,
+    row_hashes,
+    source_rows,
+    stored_invoices,
+    update_snapshot,
+)
+from .invoice import RenderedDocuments, render_invoices, render_sequences, template_hash
+from .models import Invoice, InvoiceLine, InvoiceRecord, Job, JobUnit
+from .output import archive_paths, create_writer, partial_paths
+from .scenario import Scenario, ScenarioConfig
+from .types import DocumentFormat, JobKind, JobStatus, OutputFormat, PdfOptimize
+
+
+def create_job(
+    kind: JobKind,
+    total: int,
+    params: dict | None = None,
+    seed: int | None = None,
+    workers: int = 1,
+) -> Job:
+    """Record a new job and its run parameters"""
+    job = Job(
+        kind=kind,
+        total=total,
+        params=json.dumps(params or {}),
+        seed=seed,
+        workers=workers,
+    )
+    with Session(DB_ENGINE) as session:
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+
+    console.print(f"Job ID: {job.id}, resume with [yellow]--resume {job.id}[/yellow]")
+
+    return job
+
+
+def get_job(job_id: int, kind: JobKind) -> Job:
+    """Load a job to resume, reject unknown jobs and jobs of another kind"""
+    with Session(DB_ENGINE) as session:
+        job = session.get(Job, job_id)
+
+    if job is None:
+        raise BadParameter(f"Job {job_id} does not exist", param_hint="'--resume'")
+    if job.kind != kind:
+        raise BadParameter(
+            f"Job {job_id} has kind {job.kind.value}, expected {kind.value}",
+            param_hint="'--resume'",
+        )
+
+    return job
+
+
+def completed_units(job_id: int) -> dict[int, list[dict]]:
+    """Return completed unit numbers and their written documents"""
+    with Session(DB_ENGINE) as session:
+        units = session.exec(select(JobUnit).where(JobUnit.job_id == job_id)).all()
+
+    return {unit.unit: json.loads(unit.documents) for unit in units}
+
+
+def finish_job(job: Job, completed: int) -> None:
+    """Set job status from the number of completed units"""
+    status = JobStatus.COMPLETED if completed >= job.total else JobStatus.INCOMPLETE
+    with Session(DB_ENGINE) as session:
+        stored_job = session.get(Job, job.id)
+        stored_job.status = status
+        stored_job.updated_at = datetime.now(UTC)
+        session.add(stored_job)
+        session.commit()
+
+    console.print(f"Job {job.id} {status.value}: {completed} out of {job.total} units")
+
+
+def run_batch_job(job: Job, generate: Callable[..., bool], label: str) -> None:
+    """Run the remaining batches of an LLM generator job
+
+    A batch is recorded as complete only after its rows are stored, so a resumed
+    job repeats only the model calls that did not finish. Job parameters are passed
+    to `generate` as keyword arguments, so a resume runs with the original options.
+    """
+    params = json.loads(job.params)
+    done = completed_units(job.id)
+
+    with Session(DB_ENGINE) as session:
+        for unit in range(job.total):
+            if unit in done:
+                continue
+            console.print(f"Generating {label} batch {unit + 1} out of {job.total}")
+            if generate(**params):
+                session.add(JobUnit(job_id=job.id, unit=unit))
+                session.commit()
+                done[unit] = []
+
+    finish_job(job, len(done))
+
+
+def run_invoice_job(job: Job) -> None:
+    """Render the remaining invoices of an invoice job
+
+    An invoice is recorded as complete once all of its documents are durable: after
+    the rename for loose files, after the shard is closed for archives.
+    """
+    params = json.loads(job.params)
+    config = ScenarioConfig.model_validate(params["scenario"])
+    formats = [DocumentFormat(value) for value in params["formats"]]
+    output = Path(params["output"])
+    output_format = OutputFormat(params["output_format"])
+    optimize = PdfOptimize(params.get("pdf_optimize", PdfOptimize.OFF))
+    shard_index, shard_count = params["shard"]
+    prefix = _archive_prefix(job)
+
+    # Invoices are sampled again in this process for their database records
+    scenario = Scenario(config)
+    template = template_hash()
+
+    done = verify_invoice_units(job, output, output_format, prefix)
+    sequences = [
+        sequence
+        for sequence in range(shard_index, params["generate"], shard_count)
+        if sequence not in done
+    ]
+    if done:
+        console.print(f"Resuming job {job.id}: {len(done)} invoices already complete")
+
+    with Session(DB_ENGINE) as session:
+        snapshot = SnapshotRecorder(session, job.id, row_hashes(source_rows(session)))
+
+        def on_invoice(sequence: int, documents: list[dict]) -> None:
+            session.add(JobUnit(job_id=job.id, unit=sequence, documents=json.dumps(documents)))
+            invoice_rows = invoice_records(job.id, sequence, scenario.sample(sequence), template)
+            session.add_all(invoice_rows)
+            snapshot.add(invoice_rows)
+            done[sequence] = documents
+
+        rendered = render_sequences(
+            config, sequences, formats, workers=job.workers, optimize=optimize
+        )
+        _write_invoices(session, job, rendered, len(sequences), on_invoice)
+
+    finish_job(job, len(done))
+    console.print(f"Output directory: {output}")
+
+
+def rerender_changed(workers: int = 1, job_ids: list[int] | None = None) -> int:
+    """Re-render stored invoices whose template or source rows changed, return their number
+
+    New documents replace the old ones: loose files are overwritten, archive jobs get
+    new shards and manifest lines, and the last manifest entry of a document wins.
+    Invoices whose supplier, customer, items or addresses were deleted are skipped.
+
+    Args:
+        workers: Number of render worker processes
+        job_ids: Check only these invoice jobs, all invoice jobs by default
+    """
+    template = template_hash()
+    with Session(DB_ENGINE) as session:
+        statement = select(Job).where(Job.kind == JobKind.INVOICE).order_by(Job.id)
+        if job_ids is not None:
+            statement = statement.where(Job.id.in_(job_ids))
+        jobs = session.exec(statement).all()
+        rows = source_rows(session)
+    hashes = row_hashes(rows)
+
+    rerendered = 0
+    for job in jobs:
+        params = json.loads(job.params)
+        formats = [DocumentFormat(value) for value in params["formats"]]
+        optimize = PdfOptimize(params.get("pdf_optimize", PdfOptimize.OFF))
+
+        with Session(DB_ENGINE) as session:
+            changed = changed_rows(session, job.id, hashes)
+            sequences = affected_sequences(session, job.id, changed, template)
+        if not sequences:
+            continue
+
+        console.print(f"Job {job.id}: re-rendering {len(sequences)} changed invoices")
+        invoices: dict[int, Invoice] = {}
+        skipped: list[int] = []
+
+        with Session(DB_ENGINE) as session:
+            # Jobs without a snapshot get one for the rows their new invoices reference
+            snapshot = SnapshotRecorder(session, job.id, hashes)
+
+            def on_invoice(sequence: int, documents: list[dict]) -> None:
+                unit = session.get(JobUnit, (job.id, sequence))
+                unit.documents = json.dumps(documents)
+                unit.completed_at = datetime.now(UTC)
+                session.add(unit)
+                _drop_invoice_records(session, job.id, {sequence})
+                invoice_rows = invoice_records(job.id, sequence, invoices.pop(sequence), template)
+                session.add_all(invoice_rows)
+                snapshot.add(invoice_rows)
+
+            stored = stored_invoices(job.id, sequences, rows, invoices, skipped)
+            rendered = render_invoices(stored, formats, workers=workers, optimize=optimize)
+            count = _write_invoices(session, job, rendered, len(sequences), on_invoice)
+            if changed is not None:
+                update_snapshot(session, job.id, hashes, changed)
+
+        rerendered += count
+        if skipped:
+            console.print(
+                f"Job {job.id}: skipped {len(skipped)} invoices with deleted source rows",
+                style="yellow",
+            )
+
+    console.print(f"Re-rendered {rerendered} invoices")
+
+    return rerendered
+
+
+def _archive_prefix(job: Job) -> str:
+    """Archive, manifest and temporary file name prefix of an invoice job
+
+    These files are owned by one job, so a resume never touches files of other runs.
+    """
+    return f"{json.loads(job.params)['prefix']}-job{job.id}"
+
+
+def _write_invoices(
+    session: Session,
+    job: Job,
+    rendered: Iterable[RenderedDocuments],
+    total: int,
+    on_invoice: Callable[[int, list[dict]], None],
+) -> int:
+    """Write rendered invoices, call `on_invoice` once all documents of an invoice are durable
+
+    Documents go to the output of the job. Every batch of durable invoices is
+    committed with `session`. Returns the number of written invoices.
+    """
+    params = json.loads(job.params)
+    # Documents of an invoice may be committed in several callbacks
+    pending: dict[str, tuple[int, int]] = {}
+    written: dict[str, list[dict]] = {}
+
+    def on_commit(entries: list[dict]) -> None:
+        for entry in entries:
+            invoice_number = entry["invoice_number"]
+            sequence, remaining = pending[invoice_number]
+            written.setdefault(invoice_number, []).append(entry)
+            if remaining > 1:
+                pending[invoice_number] = (sequence, remaining - 1)
+                continue
+            del pending[invoice_number]
+            on_invoice(sequence, written.pop(invoice_number))
+        session.commit()
+
+    count = 0
+    with create_writer(
+        OutputFormat(params["output_format"]),
+        Path(params["output"]),
+        _archive_prefix(job),
+        max_docs=params["archive_max_docs"],
+        max_bytes=params["archive_max_bytes"],
+        on_commit=on_commit,
+    ) as writer:
+        for count, (sequence, invoice_number, documents) in enumerate(rendered, start=1):
+            console.print(f"Generating invoice {count} out of {total}")
+            pending[invoice_number] = (sequence, len(documents))
+            for name, content in documents:
+                writer.write(invoice_number, name, content)
+
+    return count
+
+
+def invoice_records(
+    job_id: int, sequence: int, invoice: Invoice, template: str = ""
+) -> list[InvoiceRecord | InvoiceLine]:
+    """Database rows of a generated invoice, for analytics and re-rendering"""
+    record = InvoiceRecord(
+        job_id=job_id,
+        sequence=sequence,
+        invoice_number=invoice.invoice_number,
+        issue_date=invoice.issue_date.date(),
+        due_date=invoice.due_date.date(),
+        currency=invoice.currency,
+        supplier_id=invoice.supplier.id,
+        customer_id=invoice.customer.id,
+        subtotal=invoice.subtotal,
+        tax_total=invoice.tax_total,
+        total=invoice.total,
+        template_hash=template,
+        supplier_billing_address_id=invoice.supplier.address_billing_id,
+        supplier_shipping_address_id=invoice.supplier.address_shipping_id,
+        customer_billing_address_id=invoice.customer.address_billing_id,
+        customer_shipping_address_id=invoice.customer.address_shipping_id,
+    )
+    lines = [
+        InvoiceLine(
+            job_id=job_id,
+            sequence=sequence,
+            line=line,
+            item_id=item.id,
+            quantity=item.quantity,
+            unit_price=item.unit_price,
+            total_price=item.total_price,
+        )
+        for line, item in enumerate(invoice.line_items, start=1)
+    ]
+    return [record, *lines]
+
+
+def verify_invoice_units(
+    job: Job, output: Path, output_format: OutputFormat, prefix: str
+) -> dict[int, list[dict]]:
+    """Re-check documents of completed invoices before resuming
+
+    Units whose documents are missing or truncated are marked incomplete. Leftover
+    partial files of the job, unfinished archives and their manifest lines are removed.
+    """
+    done = completed_units(job.id)
+    if not output.exists():
+        return _drop_units(job, done, set(done))
+
+    # Other jobs may be writing to the same directory, their files are left alone
+    if done:
+        for partial_path in partial_paths(output, prefix):
+            partial_path.unlink()
+
+    if output_format == OutputFormat.DIR:
+        broken = {
+            unit
+            for unit, documents in done.items()
+            for entry in documents
+            if not output.joinpath(entry["name"]).exists()
+            or output.joinpath(entry["name"]).stat().st_size != entry["size"]
+        }
+        return _drop_units(job, done, broken)
+
+    archive_sizes = {path.name: path.stat().st_size for path in archive_paths(output, prefix)}
+    broken = {
+        unit
+        for unit, documents in done.items()
+        for entry in documents
+        if archive_sizes.get(entry["archive"], 0) < entry["offset"] + entry["size"]
+    }
+    done = _drop_units(job, done, broken)
+    _prune_archives(output, prefix, done, set(archive_sizes))
+
+    return done
+
+
+def _prune_archives(
+    output: Path, prefix: str, done: dict[int, list[dict]], archives: set[str]
+) -> None:
+    """Remove archives and manifest lines without completed invoices"""
+    entries = [entry for documents in done.values() for entry in documents]
+    valid_archives = {entry["archive"] for entry in entries}
+    valid_invoices = {entry["invoice_number"] for entry in entries}
+
+    for name in archives - valid_archives:
+        output.joinpath(name).unlink()
+
+    manifest = output.joinpath(f"{prefix}.manifest.jsonl")
+    if manifest.exists():
+        lines = []
+        for line in manifest.read_text().splitlines():
+            entry = json.loads(line)
+            if entry["archive"] in valid_archives and entry["invoice_number"] in valid_invoices:
+                lines.append(f"{line}\n")
+        manifest.write_text("".join(lines))
+
+
+def _drop_units(job: Job, done: dict[int, list[dict]], broken: set[int]) -> dict[int, list[dict]]:
+    if broken:
+        console.print(f"Re-rendering {len(broken)} invoices with missing or partial documents")
+        with Session(DB_ENGINE) as session:
+            session.exec(delete(JobUnit).where(JobUnit.job_id == job.id, JobUnit.unit.in_(broken)))
+            _drop_invoice_records(session, job.id, broken)
+            session.commit()
+
+    return {unit: documents for unit, documents in done.items() if unit not in broken}
+
+
+def _drop_invoice_records(session: Session, job_id: int, sequences: set[int]) -> None:
+    for model in (InvoiceRecord, InvoiceLine):
+        session.exec(delete(model).where(model.job_id == job_id, model.sequence.in_(sequences)))
+
+
+def list_jobs() -> None:
+    """List generation jobs from database"""
+    with Session(DB_ENGINE) as session:
+        statement = (
+            select(Job, func.count(JobUnit.unit))
+            .join(JobUnit, isouter=True)
+            .group_by(Job.id)
+            .order_by(Job.id)
+        )
+        jobs = session.exec(statement).all()
+
+    table = Table(title="Jobs")
+
+    table.add_column("Job ID", style="cyan")
+    table.add_column("Kind", style="green")
+    table.add_column("Status", style="magenta")
+    table.add_column("Completed", justify="right", style="yellow")
+    table.add_column("Workers", justify="right", style="blue")
+    table.add_column("Seed", justify="right", style="blue")
+    table.add_column("Created UTC", style="cyan")
+
+    for job, completed in jobs:
+        table.add_row(
+            str(job.id),
+            job.kind.value,
+            job.status.value,
+            f"{completed}/{job.total}",
+            str(job.workers),
+            "" if job.seed is None else str(job.seed),
+            job.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+
+    with console.pager(styles=True):
+        console.print(table)
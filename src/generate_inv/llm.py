@@ -0,0 +1,241 @@
+"""Helpers for running LLM generators"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from collections.abc import Callable, Coroutine
+from functools import cache
+from random import Random
+from typing import Any
+
+from pydantic import ValidationError
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models import Model
+from pydantic_ai.models.function import FunctionModel
+
+BATCH_SIZE = 5
+STREAM_EXTRA_ROWS = 3
+STREAM_DEBOUNCE = 0.05
+
+REQUEST_DEADLINE = 120.0
+HEDGE_AFTER = 30.0
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+# Share of the deadline kept for the fallback model when one is configured
+FALLBACK_SHARE = 0.25
+
+
+class RequestPolicy:
+    """Deadline, hedging and fallback for model requests
+
+    A request that is still running at the p95 of recent latencies gets a hedged
+    duplicate, and the first valid result wins. When no attempt on the primary model
+    succeeds, the request is sent once more to the fallback model. The deadline covers
+    both: with a fallback model, the primary attempts get all but `FALLBACK_SHARE` of
+    it, and the fallback gets what remains.
+
+    Latencies of all finished attempts are recorded, also failed ones. Losers cancelled
+    after another attempt won are recorded as a lower bound, at least the latency of the
+    winner, so hedge wins do not pull the p95 down.
+    """
+
+    def __init__(
+        self,
+        deadline: float = REQUEST_DEADLINE,
+        hedge_after: float | None = HEDGE_AFTER,
+        fallback_model: Model | str | None = None,
+        quantile: float = HEDGE_QUANTILE,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+    ) -> None:
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.fallback_model = fallback_model
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.hedged = 0
+        self.fallbacks = 0
+
+    def hedge_delay(self) -> float | None:
+        """Seconds to wait before the hedged request, None to never hedge"""
+        if self.hedge_after is None:
+            return None
+        if len(self.latencies) < self.min_samples:
+            return self.hedge_after
+        latencies = sorted(self.latencies)
+        return latencies[min(int(len(latencies) * self.quantile), len(latencies) - 1)]
+
+    def run(self, agent: Agent, user_prompt: str) -> Any:
+        """Run the agent under the policy, return the first valid result data"""
+        return run_sync(self.run_async(agent, user_prompt))
+
+    async def run_async(self, agent: Agent, user_prompt: str) -> Any:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        if self.fallback_model is None:
+            return await self._run_primary(agent, user_prompt, deadline)
+
+        try:
+            return await self._run_primary(
+                agent, user_prompt, deadline - self.deadline * FALLBACK_SHARE
+            )
+        except Exception:
+            self.fallbacks += 1
+        async with asyncio.timeout_at(deadline):
+            result = await agent.run(user_prompt, model=self.fallback_model)
+        return result.data
+
+    async def _run_primary(self, agent: Agent, user_prompt: str, deadline: float) -> Any:
+        started: dict[asyncio.Task, float] = {}
+
+        def attempt() -> asyncio.Task:
+            task = asyncio.create_task(agent.run(user_prompt))
+            started[task] = time.perf_counter()
+            return task
+
+        tasks = {attempt()}
+        hedge_delay = self.hedge_delay()
+        loop = asyncio.get_running_loop()
+        error: BaseException = TimeoutError(
+            f"No model response in {deadline - loop.time():.1f} seconds"
+        )
+        winner_latency = 0.0
+        try:
+            while tasks:
+                hedge_pending = hedge_delay is not None
+                timeout = deadline - loop.time()
+                if hedge_pending:
+                    timeout = min(timeout, hedge_delay)
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                finished = time.perf_counter()
+                for task in done:
+                    latency = finished - started[task]
+                    self.latencies.append(latency)
+                    if task.exception() is None:
+                        winner_latency = latency
+                        return task.result().data
+                    error = task.exception()
+                if loop.time() >= deadline:
+                    break
+                if hedge_pending and not done:
+                    # Still waiting at the hedge delay, send the duplicate request once
+                    self.hedged += 1
+                    hedge_delay = None
+                    tasks.add(attempt())
+            raise error
+        finally:
+            cancelled = time.perf_counter()
+            for task in tasks:
+                task.cancel()
+                # Only a lower bound, the cancelled attempt would not have beaten the winner
+                self.latencies.append(max(cancelled - started[task], winner_latency))
+
+
+@cache
+def request_policy() -> RequestPolicy:
+    """Process wide request policy configured from settings"""
+    # Settings exit without an API key, they are loaded only once a policy is needed
+    from .settings import (  # noqa: PLC0415
+        ANTHROPIC_FALLBACK_MODEL,
+        LLM_DEADLINE,
+        LLM_HEDGE_AFTER,
+    )
+
+    return RequestPolicy(LLM_DEADLINE, LLM_HEDGE_AFTER, ANTHROPIC_FALLBACK_MODEL)
+
+
+@cache
+def _runner() -> asyncio.Runner:
+    return asyncio.Runner()
+
+
+def run_sync(coroutine: Coroutine) -> Any:
+    """Run a coroutine on the event loop shared by all model requests
+
+    pydantic-ai shares one HTTP client between agents, and its pooled connections are
+    bound to the loop that opened them, so a new loop per call breaks later requests.
+    """
+    return _runner().run(coroutine)
+
+
+def simulated_model(
+    rows: list[dict],
+    median: float = 0.05,
+    slow_rate: float = 0.05,
+    slow_factor: float = 20.0,
+    seed: int = 0,
+) -> FunctionModel:
+    """Stub model returning `rows` after a simulated, heavy tailed latency
+
+    Latency is log-normal around `median`, and a `slow_rate` share of responses
+    is `slow_factor` times slower, like an overloaded API replica.
+    """
+    rng = Random(seed)
+    content = json.dumps({"response": rows})
+
+    async def respond(messages, info) -> ModelResponse:
+        latency = rng.lognormvariate(0, 0.25) * median
+        if rng.random() < slow_rate:
+            latency *= slow_factor
+        await asyncio.sleep(latency)
+        return ModelResponse(parts=[ToolCallPart(info.result_tools[0].name, content)])
+
+    return FunctionModel(respond)
+
+
+def stream_rows(
+    agent: Agent,
+    user_prompt: str,
+    store: Callable[[Any], bool],
+    limit: int,
+    deadline: float | None = None,
+) -> None:
+    """Stream a list result and store every element as soon as it is complete
+
+    The rest of the stream is cancelled once `limit` new rows are stored.
+
+    Args:
+        agent: Agent with a `list[...]` result type
+        user_prompt: User prompt
+        store: Stores one row, returns False for duplicate rows
+        limit: Number of new rows to stop at
+        deadline: Seconds until the stream is cancelled, rows stored so far are kept
+    """
+    run_sync(_stream_rows(agent, user_prompt, store, limit, deadline))
+
+
+async def _stream_rows(
+    agent: Agent,
+    user_prompt: str,
+    store: Callable[[Any], bool],
+    limit: int,
+    deadline: float | None,
+) -> None:
+    async with asyncio.timeout(deadline):
+        await _store_stream(agent, user_prompt, store, limit)
+
+
+async def _store_stream(
+    agent: Agent, user_prompt: str, store: Callable[[Any], bool], limit: int
+) -> None:
+    new, stored = 0, 0
+
+    async with agent.run_stream(user_prompt=user_prompt) as result:
+        async for message, last in result.stream_structured(debounce_by=STREAM_DEBOUNCE):
+            try:
+                rows = await result.validate_structured_result(message, allow_partial=not last)
+            except ValidationError:
+                continue
+
+            # Until the stream ends, the last element may still be growing
+            complete = len(rows) if last else len(rows) - 1
+            for row in rows[stored:complete]:
+                stored += 1
+                new += store(row)
+                if new >= limit:
+                    return
@@ -0,0 +1,105 @@
+"""Versioned database schema migrations
+
+`create_all` creates missing tables only. Changes to existing tables are ordered
+migration steps, each applied once and recorded in the `schemaversion` table.
+Steps must also be safe on a database just created from the current models.
+"""
+
+from collections.abc import Callable
+from datetime import UTC, datetime
+
+from sqlalchemy import Connection, Engine, func, insert, inspect, select, text
+
+from . import console
+from .models import SchemaVersion
+
+Migration = Callable[[Connection], None]
+
+
+def _index_company_addresses(connection: Connection) -> None:
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_company_address_billing_id "
+            "ON company (address_billing_id)"
+        )
+    )
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_company_address_shipping_id "
+            "ON company (address_shipping_id)"
+        )
+    )
+
+
+INVOICE_DEPENDENCY_COLUMNS = {
+    "template_hash": "VARCHAR NOT NULL DEFAULT ''",
+    "supplier_billing_address_id": "INTEGER REFERENCES address (id)",
+    "supplier_shipping_address_id": "INTEGER REFERENCES address (id)",
+    "customer_billing_address_id": "INTEGER REFERENCES address (id)",
+    "customer_shipping_address_id": "INTEGER REFERENCES address (id)",
+}
+
+
+def _add_columns(connection: Connection, table_name: str, columns: dict[str, str]) -> None:
+    existing = {column["name"] for column in inspect(connection).get_columns(table_name)}
+    for name, definition in columns.items():
+        if name not in existing:
+            connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {definition}"))
+
+
+def _add_invoice_dependencies(connection: Connection) -> None:
+    _add_columns(connection, "invoicerecord", INVOICE_DEPENDENCY_COLUMNS)
+    for name in INVOICE_DEPENDENCY_COLUMNS:
+        if name.endswith("_id"):
+            connection.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS ix_invoicerecord_{name} ON invoicerecord ({name})"
+                )
+            )
+
+
+def _add_stats_sketches(connection: Connection) -> None:
+    _add_columns(
+        connection,
+        "tablestats",
+        {"refreshed_at": "DATETIME", "max_id": "INTEGER NOT NULL DEFAULT 0"},
+    )
+    _add_columns(connection, "columnstats", {"sketch": "BLOB"})
+
+
+MIGRATIONS: list[tuple[str, Migration]] = [
+    ("Index company billing and shipping address foreign keys", _index_company_addresses),
+    ("Track template hash and addresses of stored invoices", _add_invoice_dependencies),
+    ("Add distinct value sketches and snapshot time to statistics", _add_stats_sketches),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(connection: Connection) -> int:
+    """Return number of the last applied migration"""
+    statement = select(func.max(SchemaVersion.version))
+    return connection.execute(statement).scalar() or 0
+
+
+def migrate(engine: Engine) -> int:
+    """Apply pending migrations in order, return the schema version
+
+    Every step runs in its own transaction together with its version record.
+    """
+    with engine.connect() as connection:
+        current = schema_version(connection)
+
+    for version, (description, migration) in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        with engine.begin() as connection:
+            migration(connection)
+            connection.execute(
+                insert(SchemaVersion).values(
+                    version=version, description=description, applied_at=datetime.now(UTC)
+                )
+            )
+        console.print(f"Applied database migration {version}: {description}")
+
+    return SCHEMA_VERSION
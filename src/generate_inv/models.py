@@ -1,12 +1,13 @@
-from datetime import datetime, timedelta
+from datetime import UTC, date, datetime, timedelta
 from decimal import Decimal
+from functools import cache
 
 from pydantic import BaseModel, model_validator
 from sqlmodel import Field, SQLModel
 
 from . import console
 from .database import DB_ENGINE
-from .types import Currency
+from .types import Currency, JobKind, JobStatus
 
 
 class InvoiceItem(SQLModel, table=True):
@@ -92,11 +93,13 @@ class Company(SQLModel, table=True):
     address_billing_id: int | None = Field(
         description="Company billing address",
         foreign_key="address.id",
+        index=True,
     )
     address_shipping_id: int | None = Field(
         description="Company shipping address",
         default=None,
         foreign_key="address.id",
+        index=True,
     )
     phone_number: str = Field(
         description="Phone number. The phone number must be in North American Numbering Plan (NANP) format. Example: +1 (416) 456-7890",
@@ -109,6 +112,279 @@ class Company(SQLModel, table=True):
     )
 
 
+class SchemaVersion(SQLModel, table=True):
+    version: int = Field(
+        description="Applied migration number",
+        primary_key=True,
+    )
+    description: str = Field(
+        description="Migration description",
+    )
+    applied_at: datetime = Field(
+        description="Migration time",
+        default_factory=lambda: datetime.now(UTC),
+    )
+
+
+class TableStats(SQLModel, table=True):
+    table_name: str = Field(
+        description="Database table name",
+        primary_key=True,
+    )
+    row_count: int = Field(
+        description="Number of rows, maintained incrementally by the writers",
+        default=0,
+    )
+    byte_size: int | None = Field(
+        description="Table and index size in bytes, refreshed by exact statistics",
+        default=None,
+    )
+    refreshed_at: datetime | None = Field(
+        description="Last exact statistics refresh, the time of the byte size snapshot",
+        default=None,
+    )
+    max_id: int = Field(
+        description="Highest row ID folded into the column sketches",
+        default=0,
+        sa_column_kwargs={"server_default": "0"},
+    )
+    updated_at: datetime = Field(
+        description="Last statistics update",
+        default_factory=lambda: datetime.now(UTC),
+    )
+
+
+class ColumnStats(SQLModel, table=True):
+    table_name: str = Field(
+        description="Database table name",
+        primary_key=True,
+    )
+    column_name: str = Field(
+        description="Column name",
+        primary_key=True,
+    )
+    distinct_count: int = Field(
+        description="Number of distinct values, exact after a refresh, estimated from the sketch after inserts",
+        default=0,
+    )
+    sketch: bytes | None = Field(
+        description="HyperLogLog registers of the column values",
+        default=None,
+    )
+
+
+class Job(SQLModel, table=True):
+    id: int | None = Field(
+        default=None,
+        primary_key=True,
+    )
+    kind: JobKind = Field(
+        description="Generator that runs the job",
+    )
+    params: str = Field(
+        description="Run parameters as JSON",
+        default="{}",
+    )
+    seed: int | None = Field(
+        description="Random seed of the run",
+        default=None,
+    )
+    total: int = Field(
+        description="Number of work units",
+    )
+    workers: int = Field(
+        description="Number of concurrent workers",
+        default=1,
+    )
+    status: JobStatus = Field(
+        description="Job status",
+        default=JobStatus.RUNNING,
+    )
+    created_at: datetime = Field(
+        description="Job creation time",
+        default_factory=lambda: datetime.now(UTC),
+    )
+    updated_at: datetime = Field(
+        description="Last job update",
+        default_factory=lambda: datetime.now(UTC),
+    )
+
+
+class JobUnit(SQLModel, table=True):
+    job_id: int = Field(
+        description="Job the unit belongs to",
+        foreign_key="job.id",
+        primary_key=True,
+    )
+    unit: int = Field(
+        description="Work unit number, invoice sequence or generator batch",
+        primary_key=True,
+    )
+    documents: str = Field(
+        description="Written documents as JSON list of manifest entries",
+        default="[]",
+    )
+    completed_at: datetime = Field(
+        description="Unit completion time",
+        default_factory=lambda: datetime.now(UTC),
+    )
+
+
+class InvoiceRecord(SQLModel, table=True):
+    job_id: int = Field(
+        description="Job that generated the invoice",
+        foreign_key="job.id",
+        primary_key=True,
+    )
+    sequence: int = Field(
+        description="Invoice sequence number within the job",
+        primary_key=True,
+    )
+    invoice_number: str = Field(
+        description="Invoice number",
+    )
+    issue_date: date = Field(
+        description="Invoice issue date",
+    )
+    due_date: date = Field(
+        description="Invoice due date",
+    )
+    currency: Currency = Field(
+        description="Invoice currency",
+    )
+    supplier_id: int = Field(
+        description="Supplier company",
+        foreign_key="company.id",
+        index=True,
+    )
+    customer_id: int = Field(
+        description="Customer company",
+        foreign_key="company.id",
+        index=True,
+    )
+    subtotal: Decimal = Field(
+        description="Subtotal of invoice lines",
+        decimal_places=2,
+    )
+    tax_total: Decimal = Field(
+        description="Tax total",
+        decimal_places=2,
+    )
+    total: Decimal = Field(
+        description="Invoice total",
+        decimal_places=2,
+    )
+    template_hash: str = Field(
+        description="Hash of the invoice template the documents were rendered with",
+        default="",
+        sa_column_kwargs={"server_default": ""},
+    )
+    supplier_billing_address_id: int | None = Field(
+        description="Supplier billing address at render time",
+        default=None,
+        foreign_key="address.id",
+        index=True,
+    )
+    supplier_shipping_address_id: int | None = Field(
+        description="Supplier shipping address at render time",
+        default=None,
+        foreign_key="address.id",
+        index=True,
+    )
+    customer_billing_address_id: int | None = Field(
+        description="Customer billing address at render time",
+        default=None,
+        foreign_key="address.id",
+        index=True,
+    )
+    customer_shipping_address_id: int | None = Field(
+        description="Customer shipping address at render time",
+        default=None,
+        foreign_key="address.id",
+        index=True,
+    )
+
+
+class InvoiceLine(SQLModel, table=True):
+    job_id: int = Field(
+        description="Job that generated the invoice",
+        foreign_key="job.id",
+        primary_key=True,
+    )
+    sequence: int = Field(
+        description="Invoice sequence number within the job",
+        primary_key=True,
+    )
+    line: int = Field(
+        description="Line number within the invoice",
+        primary_key=True,
+    )
+    item_id: int = Field(
+        description="Invoice item",
+        foreign_key="invoiceitem.id",
+        index=True,
+    )
+    quantity: int = Field(
+        description="Quantity",
+    )
+    unit_price: Decimal = Field(
+        description="Unit price",
+        decimal_places=2,
+    )
+    total_price: Decimal = Field(
+        description="Line total",
+        decimal_places=2,
+    )
+
+
+class RowSnapshot(SQLModel, table=True):
+    job_id: int = Field(
+        description="Job whose invoices were rendered from the row",
+        foreign_key="job.id",
+        primary_key=True,
+    )
+    table_name: str = Field(
+        description="Source table name",
+        primary_key=True,
+    )
+    row_id: int = Field(
+        description="Source row ID",
+        primary_key=True,
+    )
+    row_hash: str = Field(
+        description="Hash of the row content at render time",
+    )
+
+
+class MinHashSignature(SQLModel, table=True):
+    table_name: str = Field(
+        description="Indexed table name",
+        primary_key=True,
+    )
+    row_id: int = Field(
+        description="Indexed row ID",
+        primary_key=True,
+    )
+    signature: bytes = Field(
+        description="MinHash signature of the indexed column",
+    )
+
+
+class LshBucket(SQLModel, table=True):
+    table_name: str = Field(
+        description="Indexed table name",
+        primary_key=True,
+    )
+    bucket: int = Field(
+        description="Hash of one MinHash signature band",
+        primary_key=True,
+    )
+    row_id: int = Field(
+        description="Indexed row ID",
+        primary_key=True,
+    )
+
+
 class Invoice(BaseModel):
     invoice_number: str = Field(
         description="Unique invoice identifier",
@@ -117,7 +393,7 @@ class Invoice(BaseModel):
         description="Date when invoice was issued",
         default_factory=lambda: datetime.now(),
     )
-    payment_terms: datetime = Field(
+    payment_terms: int = Field(
         description="Payment terms number of days from issue date",
         default=30,
     )
@@ -184,18 +460,30 @@ class Invoice(BaseModel):
         return f"{self.tax_rate * Decimal(100)}" + "%"
 
 
+@cache
+def _migrate_schema() -> None:
+    """Create missing tables and apply pending migrations, cached once it succeeded"""
+    from .migrations import migrate  # noqa: PLC0415, import cycle
+
+    SQLModel.metadata.create_all(DB_ENGINE)
+    migrate(DB_ENGINE)
+
+
 def create_db_schema() -> bool:
-    """Create or migrate database schema"""
+    """Create or migrate database schema, once per process"""
     try:
-        SQLModel.metadata.create_all(DB_ENGINE)
-        return True
+        _migrate_schema()
     except Exception as error:
         console.print(error)
         return False
 
+    return True
+
 
 def drop_db_schema() -> bool:
     """Drop database schema"""
+    _migrate_schema.cache_clear()
+
     try:
         SQLModel.metadata.drop_all(DB_ENGINE)
         return True
@@ -0,0 +1,220 @@
+"""Invoice document writers: loose files or rolling ZIP/tar archive shards"""
+
+import hashlib
+import io
+import json
+import tarfile
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from pathlib import Path
+from typing import IO, Self
+
+from . import ARCHIVE_MAX_BYTES, ARCHIVE_MAX_DOCS
+from .types import OutputFormat
+
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+CommitCallback = Callable[[list[dict]], None]
+
+
+class DirectoryWriter:
+    """Write every document as a file in the output directory
+
+    Files are written under a temporary name and renamed, so a file with the final
+    name is always complete. Temporary names carry the prefix, so writers sharing the
+    directory can tell their files apart. `on_commit` receives the manifest entries of
+    documents once they are durable.
+    """
+
+    def __init__(
+        self,
+        output: Path,
+        prefix: str = "invoices",
+        on_commit: CommitCallback | None = None,
+    ) -> None:
+        self.output = output
+        self.output.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.on_commit = on_commit
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, invoice_number: str, name: str, data: bytes) -> None:
+        path = self.output.joinpath(name)
+        partial_path = path.with_name(f"{name}.{self.prefix}.part")
+        partial_path.write_bytes(data)
+        partial_path.replace(path)
+
+        if self.on_commit is not None:
+            self.on_commit([document_entry(invoice_number, name, data)])
+
+    def close(self) -> None:
+        pass
+
+
+class ArchiveWriter(DirectoryWriter, ABC):
+    """Stream documents into rolling archive shards with a JSON Lines manifest
+
+    Documents are stored uncompressed, so the manifest offset and size address
+    the document bytes directly inside the archive file.
+    """
+
+    suffix = ""
+
+    def __init__(
+        self,
+        output: Path,
+        prefix: str = "invoices",
+        max_docs: int = ARCHIVE_MAX_DOCS,
+        max_bytes: int = ARCHIVE_MAX_BYTES,
+        on_commit: CommitCallback | None = None,
+    ) -> None:
+        super().__init__(output, prefix, on_commit)
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+
+        shards = [int(path.stem.rsplit("-", 1)[1]) for path in archive_paths(output, prefix)]
+        self.shard = max(shards, default=-1) + 1
+        self.archive_path: Path | None = None
+        self.archive_entries: list[dict] = []
+        self._file: IO[bytes] | None = None
+        self.manifest = self.output.joinpath(f"{prefix}.manifest.jsonl").open("a", buffering=1)
+
+    def write(self, invoice_number: str, name: str, data: bytes) -> None:
+        if self._file is None or (
+            len(self.archive_entries) >= self.max_docs
+            or self._file.tell() + len(data) > self.max_bytes
+        ):
+            self._roll()
+
+        offset = self._add(name, data)
+
+        entry = document_entry(invoice_number, name, data)
+        entry.update(archive=self.archive_path.name, offset=offset)
+        self.archive_entries.append(entry)
+        self.manifest.write(json.dumps(entry) + "\n")
+
+    def close(self) -> None:
+        self._close_archive()
+        self.manifest.close()
+
+    def _roll(self) -> None:
+        self._close_archive()
+        self.archive_path = self.output.joinpath(f"{self.prefix}-{self.shard:05d}{self.suffix}")
+        self.shard += 1
+        self._file = self.archive_path.open("wb")
+        self._open()
+
+    def _close_archive(self) -> None:
+        if self._file is not None:
+            self._close()
+            self._file.close()
+            self._file = None
+
+            entries, self.archive_entries = self.archive_entries, []
+            if self.on_commit is not None:
+                self.on_commit(entries)
+
+    @abstractmethod
+    def _open(self) -> None:
+        """Start a new archive in the current shard file"""
+
+    @abstractmethod
+    def _add(self, name: str, data: bytes) -> int:
+        """Append document to the current archive, return offset of its data"""
+
+    @abstractmethod
+    def _close(self) -> None:
+        """Finish the current archive, the shard file is closed by the caller"""
+
+
+class ZipArchiveWriter(ArchiveWriter):
+    suffix = ".zip"
+
+    def _open(self) -> None:
+        self._archive = zipfile.ZipFile(self._file, "w", compression=zipfile.ZIP_STORED)
+
+    def _add(self, name: str, data: bytes) -> int:
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        self._archive.writestr(info, data)
+        return self._file.tell() - len(data)
+
+    def _close(self) -> None:
+        self._archive.close()
+
+
+class TarArchiveWriter(ArchiveWriter):
+    suffix = ".tar"
+
+    def _open(self) -> None:
+        # Stays open across writes, closed in _close
+        self._archive = tarfile.open(  # noqa: SIM115
+            fileobj=self._file, mode="w", format=tarfile.PAX_FORMAT
+        )
+
+    def _add(self, name: str, data: bytes) -> int:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._archive.addfile(info, io.BytesIO(data))
+        padded_size = -(-len(data) // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE
+        return self._file.tell() - padded_size
+
+    def _close(self) -> None:
+        self._archive.close()
+
+
+def create_writer(  # noqa: PLR0913, archive options are keyword-only
+    output_format: OutputFormat,
+    output: Path,
+    prefix: str = "invoices",
+    *,
+    max_docs: int = ARCHIVE_MAX_DOCS,
+    max_bytes: int = ARCHIVE_MAX_BYTES,
+    on_commit: CommitCallback | None = None,
+) -> DirectoryWriter:
+    """Create invoice document writer for the output format"""
+    if output_format == OutputFormat.ZIP:
+        return ZipArchiveWriter(output, prefix, max_docs, max_bytes, on_commit)
+    if output_format == OutputFormat.TAR:
+        return TarArchiveWriter(output, prefix, max_docs, max_bytes, on_commit)
+    return DirectoryWriter(output, prefix, on_commit)
+
+
+def document_entry(invoice_number: str, name: str, data: bytes) -> dict:
+    """Manifest entry of one document"""
+    return {
+        "invoice_number": invoice_number,
+        "name": name,
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+
+
+def partial_paths(output: Path, prefix: str) -> list[Path]:
+    """Temporary files left by a directory writer with the prefix"""
+    return sorted(output.glob(f"*.{prefix}.part"))
+
+
+def archive_paths(output: Path, prefix: str) -> list[Path]:
+    """Archive shards written with the prefix, in shard order"""
+    pattern = f"{prefix}-{'[0-9]' * 5}"
+    return sorted(
+        path
+        for suffix in (ZipArchiveWriter.suffix, TarArchiveWriter.suffix)
+        for path in output.glob(f"{pattern}{suffix}")
+    )
+
+
+def read_document(output: Path, entry: dict) -> bytes:
+    """Read one document addressed by a manifest entry without extracting the archive"""
+    with output.joinpath(entry["archive"]).open("rb") as file:
+        file.seek(entry["offset"])
+        return file.read(entry["size"])
@@ -0,0 +1,229 @@
+"""Realistic invoice distribution engine"""
+
+import tomllib
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from random import Random
+
+from pydantic import BaseModel, Field, model_validator
+from sqlmodel import Session, select
+
+from .database import DB_ENGINE
+from .models import Address, Company, Invoice, InvoiceItem
+from .types import Currency
+
+MIN_COMPANIES = 2
+SATURDAY = 5
+
+
+class AliasTable:
+    """Walker/Vose alias table for O(1) sampling from a discrete distribution"""
+
+    def __init__(self, weights: list[float]) -> None:
+        size = len(weights)
+        total = sum(weights)
+        if size == 0 or total <= 0:
+            raise ValueError("Alias table requires at least one positive weight")
+
+        scaled = [weight * size / total for weight in weights]
+        self.prob = [0.0] * size
+        self.alias = list(range(size))
+
+        small = [index for index, value in enumerate(scaled) if value < 1.0]
+        large = [index for index, value in enumerate(scaled) if value >= 1.0]
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+
+        for index in small + large:
+            self.prob[index] = 1.0
+
+    def __len__(self) -> int:
+        return len(self.prob)
+
+    def sample(self, rng: Random) -> int:
+        """Draw one index"""
+        column = int(rng.random() * len(self.prob))
+        return column if rng.random() < self.prob[column] else self.alias[column]
+
+
+def zipf_weights(size: int, exponent: float) -> list[float]:
+    """Zipf weights for ranks 1..size"""
+    return [1.0 / rank**exponent for rank in range(1, size + 1)]
+
+
+class ScenarioConfig(BaseModel):
+    seed: int = Field(
+        description="Base random seed, every invoice derives its own seed from it",
+        default=0,
+    )
+    customer_zipf: float = Field(
+        description="Zipf exponent of customer popularity",
+        default=1.1,
+    )
+    supplier_zipf: float = Field(
+        description="Zipf exponent of supplier popularity",
+        default=0.8,
+    )
+    item_zipf: float = Field(
+        description="Zipf exponent of item popularity within a supplier catalogue",
+        default=1.0,
+    )
+    items_per_supplier: int = Field(
+        description="Number of items each supplier has an affinity to",
+        default=50,
+        gt=0,
+    )
+    min_line_items: int = Field(
+        description="Minimum number of line items per invoice",
+        default=1,
+        gt=0,
+    )
+    max_line_items: int = Field(
+        description="Maximum number of line items per invoice",
+        default=10,
+        gt=0,
+    )
+    start_date: date = Field(
+        description="First possible issue date",
+        default_factory=lambda: date.today() - timedelta(days=365),
+    )
+    end_date: date = Field(
+        description="Last possible issue date",
+        default_factory=date.today,
+    )
+    monthly_weights: list[float] = Field(
+        description="Relative issue date weight of each month, January first",
+        default=[0.8, 0.8, 1.0, 1.0, 1.0, 0.9, 0.8, 0.9, 1.1, 1.1, 1.3, 1.5],
+        min_length=12,
+        max_length=12,
+    )
+    weekend_weight: float = Field(
+        description="Relative issue date weight of Saturday and Sunday",
+        default=0.2,
+    )
+    payment_terms: dict[int, float] = Field(
+        description="Payment terms in days and their relative weight",
+        default={0: 0.05, 15: 0.15, 30: 0.6, 45: 0.1, 60: 0.1},
+    )
+    currencies: dict[Currency, float] = Field(
+        description="Invoice currency and its relative weight",
+        default={Currency.CAD: 0.8, Currency.USD: 0.2},
+    )
+
+    @model_validator(mode="after")
+    def check_ranges(self) -> "ScenarioConfig":
+        if self.min_line_items > self.max_line_items:
+            raise ValueError("min_line_items must not be greater than max_line_items")
+        if self.end_date < self.start_date:
+            raise ValueError("end_date must not be before start_date")
+        return self
+
+    @classmethod
+    def from_toml(cls, path: Path) -> "ScenarioConfig":
+        """Load scenario configuration from TOML file"""
+        with open(path, "rb") as file:
+            return cls.model_validate(tomllib.load(file))
+
+
+class Scenario:
+    """Precomputed sampling state for generating invoices without per-invoice SQL"""
+
+    def __init__(self, config: ScenarioConfig | None = None) -> None:
+        self.config = config or ScenarioConfig()
+
+        with Session(DB_ENGINE) as session:
+            self.companies = list(session.exec(select(Company).order_by(Company.id)).all())
+            self.items = list(session.exec(select(InvoiceItem).order_by(InvoiceItem.id)).all())
+            self.addresses = {
+                address.id: address for address in session.exec(select(Address)).all()
+            }
+
+        if len(self.companies) < MIN_COMPANIES or not self.items:
+            raise ValueError("Scenario requires at least 2 companies and 1 invoice item")
+
+        self._build_tables()
+
+    def _build_tables(self) -> None:
+        config = self.config
+        rng = Random(config.seed)
+
+        # Popularity ranks are shuffled so that the Zipf head is not always the oldest rows
+        customer_ranks = list(range(len(self.companies)))
+        rng.shuffle(customer_ranks)
+        self.customer_order = customer_ranks
+        self.customer_table = AliasTable(zipf_weights(len(customer_ranks), config.customer_zipf))
+
+        supplier_ranks = list(range(len(self.companies)))
+        rng.shuffle(supplier_ranks)
+        self.supplier_order = supplier_ranks
+        self.supplier_table = AliasTable(zipf_weights(len(supplier_ranks), config.supplier_zipf))
+
+        catalogue_size = min(config.items_per_supplier, len(self.items))
+        self.catalogue_table = AliasTable(zipf_weights(catalogue_size, config.item_zipf))
+        self.catalogues = []
+        for company in self.companies:
+            catalogue_rng = Random(f"{config.seed}:{company.company_id}")
+            self.catalogues.append(catalogue_rng.sample(range(len(self.items)), catalogue_size))
+
+        days = (config.end_date - config.start_date).days + 1
+        self.dates = [config.start_date + timedelta(days=day) for day in range(days)]
+        self.date_table = AliasTable(
+            [
+                config.monthly_weights[day.month - 1]
+                * (config.weekend_weight if day.weekday() >= SATURDAY else 1.0)
+                for day in self.dates
+            ]
+        )
+
+        self.terms = list(config.payment_terms)
+        self.terms_table = AliasTable(list(config.payment_terms.values()))
+
+        self.currencies = list(config.currencies)
+        self.currency_table = AliasTable(list(config.currencies.values()))
+
+    def invoice_number(self, sequence: int) -> str:
+        """Invoice number of invoice `sequence`"""
+        return f"INV-{sequence + 1:08d}"
+
+    def sample(self, sequence: int) -> Invoice:
+        """Sample invoice number `sequence`, the result depends only on the seed and sequence"""
+        config = self.config
+        rng = Random(f"{config.seed}:{sequence}")
+
+        supplier_index = self.supplier_order[self.supplier_table.sample(rng)]
+        customer_index = supplier_index
+        while customer_index == supplier_index:
+            customer_index = self.customer_order[self.customer_table.sample(rng)]
+
+        catalogue = self.catalogues[supplier_index]
+        count = rng.randint(
+            min(config.min_line_items, len(catalogue)),
+            min(config.max_line_items, len(catalogue)),
+        )
+        picked: dict[int, None] = {}
+        while len(picked) < count:
+            picked[catalogue[self.catalogue_table.sample(rng)]] = None
+
+        issue_date = datetime.combine(self.dates[self.date_table.sample(rng)], datetime.min.time())
+        payment_terms = self.terms[self.terms_table.sample(rng)]
+
+        return Invoice(
+            invoice_number=self.invoice_number(sequence),
+            issue_date=issue_date,
+            payment_terms=payment_terms,
+            due_date=issue_date + timedelta(days=payment_terms),
+            supplier=self.companies[supplier_index],
+            customer=self.companies[customer_index],
+            line_items=[self.items[index] for index in picked],
+            currency=self.currencies[self.currency_table.sample(rng)],
+        )
+
+
+if __name__ == "__main__":
+    scenario = Scenario()
+    print(scenario.sample(0).model_dump_json(indent=2))
@@ -0,0 +1,291 @@
+"""Invoice rendering HTTP service with warm render workers"""
+
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from . import console
+from .invoice import init_render_worker, render_sequence
+from .scenario import Scenario, ScenarioConfig
+from .types import DocumentFormat, PdfOptimize
+
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8000
+BATCH_SIZE = 16
+BATCH_WAIT = 0.005
+REQUEST_TIMEOUT = 60.0
+WARM_UP_TIMEOUT = 120.0
+
+CONTENT_TYPES = {
+    DocumentFormat.PDF: "application/pdf",
+    DocumentFormat.HTML: "text/html; charset=utf-8",
+    DocumentFormat.PNG: "image/png",
+}
+
+
+def _warm_up(barrier) -> int:
+    """Render one invoice so fonts and the layout engine are loaded before requests
+
+    Every task waits at the barrier after its render, so no worker can take a second
+    warm-up task and each worker renders exactly once.
+    """
+    render_sequence(0, [DocumentFormat.PDF])
+    barrier.wait(WARM_UP_TIMEOUT)
+    return os.getpid()
+
+
+def _render_batch(sequences: list[int], document_format: DocumentFormat) -> list[list[bytes]]:
+    """Render a batch of invoices in one worker task, return the documents of each invoice
+
+    PDF and HTML are one document, PNG is one document per page.
+    """
+    return [
+        [content for _, content in render_sequence(sequence, [document_format])[2]]
+        for sequence in sequences
+    ]
+
+
+class RenderBatcher:
+    """Collect concurrent render requests into batches for the worker pool
+
+    Requests that arrive within `wait` seconds of each other are sent to a worker as
+    one task, up to `size` invoices. Requests for the same invoice share one render.
+    """
+
+    def __init__(
+        self, executor: ProcessPoolExecutor, size: int = BATCH_SIZE, wait: float = BATCH_WAIT
+    ) -> None:
+        self.executor = executor
+        self.size = size
+        self.wait = wait
+        self.requests: queue.Queue[tuple[int, DocumentFormat, Future] | None] = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="render-batcher", daemon=True)
+        self.thread.start()
+
+    def render(self, sequence: int, document_format: DocumentFormat) -> Future:
+        """Queue an invoice render, the future resolves to the list of document bytes"""
+        future: Future = Future()
+        self.requests.put((sequence, document_format, future))
+        return future
+
+    def close(self) -> None:
+        self.requests.put(None)
+        self.thread.join()
+
+    def _run(self) -> None:
+        while (request := self.requests.get()) is not None:
+            batch = [request]
+            deadline = time.monotonic() + self.wait
+            while len(batch) < self.size:
+                try:
+                    request = self.requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.requests.put(None)
+                    break
+                batch.append(request)
+            self._submit(batch)
+
+    def _submit(self, batch: list[tuple[int, DocumentFormat, Future]]) -> None:
+        waiting: dict[DocumentFormat, dict[int, list[Future]]] = {}
+        for sequence, document_format, future in batch:
+            waiting.setdefault(document_format, {}).setdefault(sequence, []).append(future)
+
+        for document_format, futures in waiting.items():
+            task = self.executor.submit(_render_batch, list(futures), document_format)
+            task.add_done_callback(lambda task, futures=futures: _resolve(task, futures))
+
+
+def _resolve(task: Future, futures: dict[int, list[Future]]) -> None:
+    error = task.exception()
+    documents = [None] * len(futures) if error else task.result()
+    for document, waiting in zip(documents, futures.values(), strict=True):
+        for future in waiting:
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(document)
+
+
+class InvoiceRequestHandler(BaseHTTPRequestHandler):
+    """Serve `GET /invoice?seed=N&format=pdf|html|png|json[&page=P]` and `GET /health`
+
+    PNG responses are one page, selected with `page` (default 1). The
+    `X-Page-Count` header has the number of pages.
+    """
+
+    server: "InvoiceServer"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            self._send(HTTPStatus.OK, "application/json", b'{"status": "ok"}')
+            return
+        if url.path != "/invoice":
+            self._send_error(HTTPStatus.NOT_FOUND, f"Unknown path {url.path}")
+            return
+
+        try:
+            sequence, format_name, page = self._invoice_params(parse_qs(url.query))
+        except ValueError as error:
+            self._send_error(HTTPStatus.BAD_REQUEST, str(error))
+            return
+        if format_name == "json":
+            invoice = self.server.scenario.sample(sequence)
+            self._send(HTTPStatus.OK, "application/json", invoice.model_dump_json().encode())
+            return
+
+        document_format = DocumentFormat(format_name)
+        try:
+            documents = self.server.batcher.render(sequence, document_format).result(
+                REQUEST_TIMEOUT
+            )
+        except Exception as error:
+            self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(error))
+            return
+        if not 1 <= page <= len(documents):
+            self._send_error(HTTPStatus.NOT_FOUND, f"Invoice has {len(documents)} pages")
+            return
+        self._send(
+            HTTPStatus.OK,
+            CONTENT_TYPES[document_format],
+            documents[page - 1],
+            {"X-Page-Count": str(len(documents))},
+        )
+
+    @staticmethod
+    def _invoice_params(query: dict[str, list[str]]) -> tuple[int, str, int]:
+        """Seed, format name and page of an invoice request, ValueError when one is invalid"""
+        try:
+            sequence = int(query["seed"][0])
+        except (KeyError, ValueError):
+            sequence = -1
+        if sequence < 0:
+            raise ValueError("seed must be a non-negative integer")
+
+        format_name = query.get("format", ["pdf"])[0]
+        if format_name != "json" and format_name not in {f.value for f in DocumentFormat}:
+            raise ValueError(f"Unknown format {format_name}")
+
+        try:
+            page = int(query.get("page", ["1"])[0])
+        except ValueError:
+            raise ValueError("page must be an integer") from None
+        return sequence, format_name, page
+
+    def _send(
+        self,
+        status: HTTPStatus,
+        content_type: str,
+        body: bytes,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: HTTPStatus, message: str) -> None:
+        self._send(status, "application/json", json.dumps({"error": message}).encode())
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class InvoiceServer(ThreadingHTTPServer):
+    """HTTP server owning the scenario, the warm worker pool and the request batcher
+
+    The scenario tables are read once through the pooled database engine, every
+    worker process builds its own copy once at start-up.
+    """
+
+    daemon_threads = True
+    # The default backlog of 5 drops bursts of connections into SYN retries
+    request_queue_size = 128
+
+    def __init__(  # noqa: PLR0913, server options are keyword-only
+        self,
+        config: ScenarioConfig,
+        *,
+        host: str = SERVE_HOST,
+        port: int = SERVE_PORT,
+        workers: int = 1,
+        batch_size: int = BATCH_SIZE,
+        batch_wait: float = BATCH_WAIT,
+        optimize: PdfOptimize = PdfOptimize.OFF,
+    ) -> None:
+        self.scenario = Scenario(config)
+        self.workers = workers
+        # Bind first, so a port in use fails before any worker process is started
+        super().__init__((host, port), InvoiceRequestHandler)
+        try:
+            # Spawned workers, forking a process with server threads may deadlock
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_render_worker,
+                initargs=(config.model_dump_json(), optimize),
+            )
+            self.batcher = RenderBatcher(self.executor, batch_size, batch_wait)
+        except BaseException:
+            super().server_close()
+            raise
+
+    def warm_up(self) -> set[int]:
+        """Start every worker process and render one invoice in each, return worker PIDs"""
+        with multiprocessing.get_context("spawn").Manager() as manager:
+            barrier = manager.Barrier(self.workers)
+            tasks = [self.executor.submit(_warm_up, barrier) for _ in range(self.workers)]
+            pids = set()
+            for task in tasks:
+                if error := task.exception():
+                    console.print(f"Render worker warm-up failed: {error!r}", style="yellow")
+                    barrier.abort()
+                else:
+                    pids.add(task.result())
+        return pids
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.batcher.close()
+        self.executor.shutdown(cancel_futures=True)
+
+
+def serve(  # noqa: PLR0913, server options are keyword-only
+    config: ScenarioConfig,
+    *,
+    host: str = SERVE_HOST,
+    port: int = SERVE_PORT,
+    workers: int = 1,
+    batch_size: int = BATCH_SIZE,
+    batch_wait: float = BATCH_WAIT,
+    optimize: PdfOptimize = PdfOptimize.OFF,
+) -> None:
+    """Serve invoices until interrupted"""
+    with InvoiceServer(
+        config,
+        host=host,
+        port=port,
+        workers=workers,
+        batch_size=batch_size,
+        batch_wait=batch_wait,
+        optimize=optimize,
+    ) as server:
+        server.warm_up()
+        console.print(f"Serving invoices on http://{host}:{server.server_port}/invoice?seed=0")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            console.print("Stopped invoice server")
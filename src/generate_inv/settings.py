@@ -5,11 +5,12 @@ import dotenv
 
 from . import CONFIG_FILE, DB_FILE, INV_DIR, console
 
-dotenv.load_dotenv(CONFIG_FILE)
-
-
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-5-haiku-latest")
+ANTHROPIC_FALLBACK_MODEL = os.getenv("ANTHROPIC_FALLBACK_MODEL") or None
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "120"))
+# 0 or empty turns hedging off
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "30") or 0) or None
 
 settings = {
     "ANTHROPIC_API_KEY": ANTHROPIC_API_KEY,
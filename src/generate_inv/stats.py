@@ -0,0 +1,190 @@
+"""Database statistics kept in metadata tables
+
+Row counts and distinct value counts are maintained on insert. Distinct counts are
+estimated from a HyperLogLog sketch per column, new rows are folded into the
+sketches by row ID. Byte sizes come from `dbstat` and are a snapshot of the last
+exact refresh.
+"""
+
+import hashlib
+import math
+from datetime import UTC, datetime
+
+from sqlalchemy import column, table, update
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, func, select
+
+from .database import DB_ENGINE
+from .models import Address, ColumnStats, Company, InvoiceItem, TableStats
+
+STATS_TABLES: list[type[SQLModel]] = [Address, Company, InvoiceItem]
+
+DISTINCT_COLUMNS: dict[type[SQLModel], list[str]] = {
+    Address: ["city", "province", "postal_code"],
+    Company: ["address_billing_id", "address_shipping_id"],
+    InvoiceItem: ["unit_price"],
+}
+
+# 2^12 registers, about 1.6% standard error
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+HASH_BITS = 64
+
+
+class HyperLogLog:
+    """HyperLogLog distinct value sketch with linear counting for small cardinalities"""
+
+    def __init__(self, registers: bytes | None = None) -> None:
+        self.registers = bytearray(registers or HLL_REGISTERS)
+
+    def add(self, value: object) -> None:
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest)
+        index = hashed >> (HASH_BITS - HLL_PRECISION)
+        remaining = hashed & ((1 << (HASH_BITS - HLL_PRECISION)) - 1)
+        rank = HASH_BITS - HLL_PRECISION - remaining.bit_length() + 1
+        self.registers[index] = max(self.registers[index], rank)
+
+    def count(self) -> int:
+        size = HLL_REGISTERS
+        zeros = self.registers.count(0)
+        if zeros == size:
+            return 0
+        estimate = 0.7213 / (1 + 1.079 / size) * size**2 / sum(2.0**-r for r in self.registers)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+
+def record_rows(session: Session, model: type[SQLModel], count: int) -> None:
+    """Add `count` rows to the table statistics in the caller transaction
+
+    The row count is incremented and rows above the sketch watermark are folded into
+    the distinct value sketches. Tables without statistics yet are left alone, they
+    are counted exactly on first use.
+    """
+    if count == 0:
+        return
+
+    statement = (
+        update(TableStats)
+        .where(TableStats.table_name == model.__tablename__)
+        .values(row_count=TableStats.row_count + count, updated_at=datetime.now(UTC))
+    )
+    session.exec(statement)
+    _fold_new_rows(session, model)
+
+
+def _fold_new_rows(session: Session, model: type[SQLModel]) -> None:
+    table_name = model.__tablename__
+    table_stats = session.get(TableStats, table_name)
+    column_names = DISTINCT_COLUMNS.get(model, [])
+    column_stats = [session.get(ColumnStats, (table_name, name)) for name in column_names]
+    # Statistics from before sketches existed are rebuilt by the next exact refresh
+    if table_stats is None or any(stats is None or stats.sketch is None for stats in column_stats):
+        return
+
+    sketches = [HyperLogLog(stats.sketch) for stats in column_stats]
+    columns = [getattr(model, name) for name in column_names]
+    rows = session.exec(select(model.id, *columns).where(model.id > table_stats.max_id)).all()
+    for row_id, *values in rows:
+        table_stats.max_id = max(table_stats.max_id, row_id)
+        for sketch, value in zip(sketches, values, strict=True):
+            if value is not None:
+                sketch.add(value)
+
+    for stats, sketch in zip(column_stats, sketches, strict=True):
+        stats.sketch = bytes(sketch.registers)
+        stats.distinct_count = sketch.count()
+        session.add(stats)
+    session.add(table_stats)
+
+
+def refresh_stats() -> None:
+    """Recompute row counts, byte sizes, distinct values and sketches
+
+    All counts are collected in one aggregate query of scalar subqueries, the
+    sketches are rebuilt from a scan of the statistics columns.
+    """
+    subqueries = []
+    for model in STATS_TABLES:
+        subqueries.append(
+            select(func.count()).select_from(model).scalar_subquery().label(model.__tablename__)
+        )
+        for column_name in DISTINCT_COLUMNS.get(model, []):
+            distinct = func.count(getattr(model, column_name).distinct())
+            subqueries.append(
+                select(distinct).scalar_subquery().label(f"{model.__tablename__}.{column_name}")
+            )
+
+    with Session(DB_ENGINE) as session:
+        counts = session.exec(select(*subqueries)).one()._mapping
+        byte_sizes = _table_byte_sizes(session)
+        now = datetime.now(UTC)
+
+        for model in STATS_TABLES:
+            table_name = model.__tablename__
+            column_names = DISTINCT_COLUMNS.get(model, [])
+            sketches = [HyperLogLog() for _ in column_names]
+            columns = [getattr(model, name) for name in column_names]
+            max_id = 0
+            for row_id, *values in session.exec(select(model.id, *columns)):
+                max_id = max(max_id, row_id)
+                for sketch, value in zip(sketches, values, strict=True):
+                    if value is not None:
+                        sketch.add(value)
+
+            session.merge(
+                TableStats(
+                    table_name=table_name,
+                    row_count=counts[table_name],
+                    byte_size=byte_sizes.get(table_name),
+                    refreshed_at=now,
+                    max_id=max_id,
+                    updated_at=now,
+                )
+            )
+            for column_name, sketch in zip(column_names, sketches, strict=True):
+                session.merge(
+                    ColumnStats(
+                        table_name=table_name,
+                        column_name=column_name,
+                        distinct_count=counts[f"{table_name}.{column_name}"],
+                        sketch=bytes(sketch.registers),
+                    )
+                )
+
+        session.commit()
+
+
+def _table_byte_sizes(session: Session) -> dict[str, int]:
+    """Table plus index bytes from the SQLite `dbstat` virtual table, when compiled in"""
+    dbstat = table("dbstat", column("name"), column("pgsize"))
+    master = table("sqlite_master", column("name"), column("tbl_name"))
+    statement = (
+        select(master.c.tbl_name, func.sum(dbstat.c.pgsize))
+        .select_from(dbstat.join(master, dbstat.c.name == master.c.name))
+        .group_by(master.c.tbl_name)
+    )
+    try:
+        return dict(session.exec(statement).all())
+    except OperationalError:
+        session.rollback()
+        return {}
+
+
+def get_stats(exact: bool = False) -> tuple[list[TableStats], list[ColumnStats]]:
+    """Return stored statistics, computing them first when exact or missing"""
+    with Session(DB_ENGINE) as session:
+        present = set(session.exec(select(TableStats.table_name)).all())
+
+    if exact or not {model.__tablename__ for model in STATS_TABLES} <= present:
+        refresh_stats()
+
+    with Session(DB_ENGINE) as session:
+        table_stats = session.exec(select(TableStats).order_by(TableStats.table_name)).all()
+        column_stats = session.exec(
+            select(ColumnStats).order_by(ColumnStats.table_name, ColumnStats.column_name)
+        ).all()
+
+    return list(table_stats), list(column_stats)
@@ -1,6 +1,37 @@
-from enum import Enum
+from enum import Enum, StrEnum
 
 
 class Currency(str, Enum):
     CAD = "CAD"
     USD = "USD"
+
+
+class OutputFormat(StrEnum):
+    DIR = "dir"
+    ZIP = "zip"
+    TAR = "tar"
+
+
+class DocumentFormat(StrEnum):
+    PDF = "pdf"
+    HTML = "html"
+    PNG = "png"
+
+
+class PdfOptimize(StrEnum):
+    OFF = "off"
+    SIZE = "size"
+    MAX = "max"
+
+
+class JobKind(StrEnum):
+    ADDRESS = "address"
+    COMPANY = "company"
+    INVOICE_ITEM = "invoice-item"
+    INVOICE = "invoice"
+
+
+class JobStatus(StrEnum):
+    RUNNING = "running"
+    COMPLETED = "completed"
+    INCOMPLETE = "incomplete"
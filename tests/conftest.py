@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session
+
+_data_dir = Path(tempfile.mkdtemp(prefix="generate-inv-test-"))
+
+# Set before generate_inv is imported, the database engine is created on import
+os.environ["GENERATE_INV_DB_FILE"] = str(_data_dir / "generate-inv.db")
+os.environ["GENERATE_INV_OUTPUT_DIR"] = str(_data_dir / "invoices")
+
+from generate_inv.database import DB_ENGINE
+from generate_inv.models import Address, Company, InvoiceItem, create_db_schema
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_data_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def weasyprint():
+    """WeasyPrint, the test is skipped when it or its Pango libraries cannot be loaded"""
+    try:
+        import weasyprint  # noqa: PLC0415, Pango is loaded on import and may be missing
+    except (ImportError, OSError) as error:
+        pytest.skip(f"WeasyPrint cannot be loaded: {error}")
+    return weasyprint
+
+
+@pytest.fixture(scope="session", autouse=True)
+def test_database():
+    """Isolated database with a few companies and invoice items"""
+    create_db_schema()
+    with Session(DB_ENGINE) as session:
+        addresses = [
+            Address(
+                address_line1=f"{number} Main St",
+                address_line2=f"Suite {number}",
+                city="Toronto",
+                province="ON",
+                postal_code="M5A 1A1",
+            )
+            for number in range(4)
+        ]
+        session.add_all(addresses)
+        session.commit()
+        session.add_all(
+            Company(
+                company_id=f"ABCDEF00{number}",
+                company_name=f"Company {number}",
+                address_billing_id=address.id,
+                address_shipping_id=address.id if number % 2 else None,
+                phone_number="+1 (416) 456-7890",
+                email=f"company{number}@example.com",
+                website="https://www.example.com",
+            )
+            for number, address in enumerate(addresses)
+        )
+        session.add_all(
+            InvoiceItem(
+                item_sku=f"SKUABC{number:03d}",
+                item_info=f"Item {number}",
+                quantity=number % 5 + 1,
+                unit_price=Decimal(f"{10 + number}.50"),
+                total_price=(number % 5 + 1) * Decimal(f"{10 + number}.50"),
+            )
+            for number in range(20)
+        )
+        session.commit()
@@ -0,0 +1,99 @@
+import sqlite3
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+from generate_inv.analytics import ANALYZE_QUERIES, analytics_connection, run_queries
+from generate_inv.models import Company, InvoiceItem, InvoiceLine, InvoiceRecord, Job
+from generate_inv.types import Currency, JobKind
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    db_file = tmp_path / "analytics.db"
+    engine = create_engine(f"sqlite:///{db_file}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Job(id=1, kind=JobKind.INVOICE, total=3))
+        for number in (1, 2):
+            session.add(
+                Company(
+                    id=number,
+                    company_id=f"ABCDEF00{number}",
+                    company_name=f"Company {number}",
+                    address_billing_id=None,
+                    phone_number="+1 (416) 456-7890",
+                    email="example@example.com",
+                    website="https://www.example.com",
+                )
+            )
+        session.add(
+            InvoiceItem(
+                id=1,
+                item_sku="MON-001",
+                item_info="Dell UltraSharp 27 Monitor",
+                quantity=2,
+                unit_price=Decimal("450.00"),
+                total_price=Decimal("900.00"),
+            )
+        )
+        invoices = [("900.00", 1), ("900.00", 1), ("2500.00", 2)]
+        for sequence, (total, supplier_id) in enumerate(invoices):
+            session.add(
+                InvoiceRecord(
+                    job_id=1,
+                    sequence=sequence,
+                    invoice_number=f"INV-{sequence + 1:08d}",
+                    issue_date=date(2025, 1, 1),
+                    due_date=date(2025, 1, 31),
+                    currency=Currency.CAD,
+                    supplier_id=supplier_id,
+                    customer_id=3 - supplier_id,
+                    subtotal=Decimal(total),
+                    tax_total=Decimal("0.00"),
+                    total=Decimal(total),
+                )
+            )
+            session.add(
+                InvoiceLine(
+                    job_id=1,
+                    sequence=sequence,
+                    line=1,
+                    item_id=1,
+                    quantity=2,
+                    unit_price=Decimal("450.00"),
+                    total_price=Decimal("900.00"),
+                )
+            )
+        session.commit()
+    engine.dispose()
+    return db_file
+
+
+def test_analyze_matches_sqlite(db_file, tmp_path):
+    pytest.importorskip("duckdb")
+
+    with analytics_connection(db_file, tmp_path / "parquet") as connection:
+        results = run_queries(connection)
+
+    assert results["Revenue per Supplier"][1] == [
+        ("Company 2", "CAD", 1, 2500.0),
+        ("Company 1", "CAD", 2, 1800.0),
+    ]
+    assert results["Item Frequency"][1] == [("MON-001", "Dell UltraSharp 27 Monitor", 3, 6)]
+
+    with sqlite3.connect(db_file) as connection:
+        for title, query in ANALYZE_QUERIES.items():
+            assert [tuple(row) for row in connection.execute(query)] == results[title][1]
+
+
+def test_analyze_quoted_paths(db_file, tmp_path):
+    pytest.importorskip("duckdb")
+
+    quoted_dir = tmp_path / "o'brien"
+    quoted_dir.mkdir()
+    quoted_db_file = db_file.rename(quoted_dir / "analytics.db")
+    with analytics_connection(quoted_db_file, quoted_dir / "parquet") as connection:
+        assert connection.execute("SELECT count(*) FROM invoicerecord").fetchone() == (3,)
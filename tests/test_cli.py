@@ -1,10 +1,31 @@
+import re
+from datetime import date
+from decimal import Decimal
+
 import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
 from typer.testing import CliRunner
 
 from generate_inv import cli
+from generate_inv.database import DB_ENGINE
+from generate_inv.dependencies import referenced_rows
+from generate_inv.jobs import rerender_changed
+from generate_inv.models import (
+    Address,
+    Company,
+    InvoiceItem,
+    InvoiceLine,
+    InvoiceRecord,
+    Job,
+    RowSnapshot,
+)
+from generate_inv.types import Currency, JobKind
 
 runner = CliRunner()
 
+# Exit code of click usage errors, like a bad parameter
+USAGE_ERROR = 2
+
 
 @pytest.mark.cli
 def test_version():
@@ -66,3 +87,222 @@ def test_company_generate():
 def test_invoice_generate():
     result = runner.invoke(cli, ["invoice", "--generate", "1"])
     assert result.exit_code == 0
+
+
+@pytest.mark.cli
+def test_invoice_generate_invalid_shard():
+    result = runner.invoke(cli, ["invoice", "--generate", "1", "--shard", "2/2"])
+    assert result.exit_code != 0
+
+
+@pytest.mark.cli
+def test_database_merge(tmp_path):
+    shard_db = tmp_path / "shard.db"
+    shard_engine = create_engine(f"sqlite:///{shard_db}")
+    SQLModel.metadata.create_all(shard_engine)
+    with Session(shard_engine) as session:
+        address = Address(
+            address_line1="1 Shard Merge Lane",
+            address_line2="Unit 1",
+            city="Toronto",
+            province="Ontario",
+            postal_code="M5A 1A1",
+        )
+        session.add(address)
+        session.commit()
+        supplier = Company(
+            company_id="SHARDM001",
+            company_name="Shard Merge Ltd.",
+            address_billing_id=address.id,
+            address_shipping_id=address.id,
+            phone_number="+1 (416) 456-7890",
+            email="merge@example.com",
+            website="https://www.example.com",
+        )
+        # Duplicates of rows in the current database, under other IDs
+        customer = Company(
+            company_id="ABCDEF003",
+            company_name="Company 3",
+            phone_number="+1 (416) 456-7890",
+            email="company3@example.com",
+            website="https://www.example.com",
+        )
+        item = InvoiceItem(
+            item_sku="SKUABC005",
+            item_info="Item 5",
+            quantity=1,
+            unit_price=Decimal("15.50"),
+            total_price=Decimal("15.50"),
+        )
+        job = Job(kind=JobKind.INVOICE, params='{"prefix": "invoices-0-of-2"}', total=1)
+        session.add_all([supplier, customer, item, job])
+        session.commit()
+        session.add_all(
+            [
+                InvoiceRecord(
+                    job_id=job.id,
+                    sequence=0,
+                    invoice_number="INV-SHARD-0",
+                    issue_date=date(2025, 1, 1),
+                    due_date=date(2025, 1, 31),
+                    currency=Currency.CAD,
+                    supplier_id=supplier.id,
+                    customer_id=customer.id,
+                    subtotal=Decimal("15.50"),
+                    tax_total=Decimal("2.02"),
+                    total=Decimal("17.52"),
+                    supplier_billing_address_id=address.id,
+                ),
+                InvoiceLine(
+                    job_id=job.id,
+                    sequence=0,
+                    line=1,
+                    item_id=item.id,
+                    quantity=1,
+                    unit_price=Decimal("15.50"),
+                    total_price=Decimal("15.50"),
+                ),
+                RowSnapshot(
+                    job_id=job.id, table_name="company", row_id=customer.id, row_hash="hash"
+                ),
+            ]
+        )
+        session.commit()
+    shard_engine.dispose()
+
+    # Merging the same shard twice adds its rows once
+    for _ in range(2):
+        result = runner.invoke(cli, ["database", "--merge", str(shard_db)])
+        assert result.exit_code == 0
+    assert "duplicate jobs: 1" in result.stdout
+
+    with Session(DB_ENGINE) as session:
+        supplier = session.exec(select(Company).where(Company.company_id == "SHARDM001")).one()
+        customer = session.exec(select(Company).where(Company.company_id == "ABCDEF003")).one()
+        item = session.exec(select(InvoiceItem).where(InvoiceItem.item_sku == "SKUABC005")).one()
+        address = session.get(Address, supplier.address_billing_id)
+        record = session.exec(
+            select(InvoiceRecord).where(InvoiceRecord.invoice_number == "INV-SHARD-0")
+        ).one()
+        line = session.exec(select(InvoiceLine).where(InvoiceLine.job_id == record.job_id)).one()
+        snapshot = session.exec(
+            select(RowSnapshot).where(RowSnapshot.job_id == record.job_id)
+        ).one()
+    assert address.address_line1 == "1 Shard Merge Lane"
+    assert (record.supplier_id, record.customer_id) == (supplier.id, customer.id)
+    assert record.supplier_billing_address_id == address.id
+    assert line.item_id == item.id
+    assert snapshot.row_id == customer.id
+
+
+@pytest.mark.cli
+def test_invoice_generate_html(tmp_path):
+    result = runner.invoke(
+        cli, ["invoice", "--generate", "1", "--format", "html", "--output", str(tmp_path)]
+    )
+    assert result.exit_code == 0
+    assert [path.suffix for path in tmp_path.iterdir()] == [".html"]
+
+
+@pytest.mark.cli
+def test_database_stats():
+    result = runner.invoke(cli, ["database", "--stats"])
+    assert result.exit_code == 0
+
+
+@pytest.mark.cli
+def test_database_stats_exact():
+    result = runner.invoke(cli, ["database", "--stats", "--exact"])
+    assert result.exit_code == 0
+    assert "address" in result.stdout
+
+
+@pytest.mark.cli
+def test_job_list():
+    result = runner.invoke(cli, ["job", "--list"])
+    assert result.exit_code == 0
+
+
+@pytest.mark.cli
+def test_invoice_resume(tmp_path):
+    invoices = 2
+    result = runner.invoke(
+        cli,
+        ["invoice", "--generate", str(invoices), "--format", "html", "--output", str(tmp_path)],
+    )
+    assert result.exit_code == 0
+    job_id = re.search(r"Job ID: (\d+)", result.stdout).group(1)
+
+    next(tmp_path.iterdir()).unlink()
+    # Only the temporary files of the resumed job are removed
+    partial = tmp_path.joinpath(f"INV-0.html.invoices-job{job_id}.part")
+    other_partial = tmp_path.joinpath(f"INV-0.html.invoices-job{job_id}0.part")
+    partial.write_bytes(b"<html>")
+    other_partial.write_bytes(b"<html>")
+    result = runner.invoke(cli, ["invoice", "--resume", job_id])
+    assert result.exit_code == 0
+    assert "Re-rendering 1 invoices" in result.stdout
+    assert not partial.exists()
+    other_partial.unlink()
+    assert len(list(tmp_path.iterdir())) == invoices
+
+
+@pytest.mark.cli
+def test_invoice_resume_unknown_job():
+    result = runner.invoke(cli, ["invoice", "--resume", "999999"])
+    assert result.exit_code == USAGE_ERROR
+    assert "Job 999999 does not exist" in result.output
+    assert "Traceback" not in result.output
+
+
+@pytest.mark.cli
+def test_address_resume_invoice_job(tmp_path):
+    result = runner.invoke(
+        cli, ["invoice", "--generate", "1", "--format", "html", "--output", str(tmp_path)]
+    )
+    job_id = re.search(r"Job ID: (\d+)", result.stdout).group(1)
+    result = runner.invoke(cli, ["address", "--resume", job_id])
+    assert result.exit_code == USAGE_ERROR
+    assert "has kind invoice, expected address" in result.output
+
+
+@pytest.mark.cli
+def test_invoice_rerender_changed(tmp_path):
+    result = runner.invoke(
+        cli, ["invoice", "--generate", "4", "--format", "html", "--output", str(tmp_path)]
+    )
+    assert result.exit_code == 0
+    job_id = int(re.search(r"Job ID: (\d+)", result.stdout).group(1))
+    assert rerender_changed(job_ids=[job_id]) == 0
+
+    # Only the rows the invoices reference are snapshot
+    with Session(DB_ENGINE) as session:
+        records = session.exec(select(InvoiceRecord).where(InvoiceRecord.job_id == job_id)).all()
+        lines = session.exec(select(InvoiceLine).where(InvoiceLine.job_id == job_id)).all()
+        snapshots = session.exec(
+            select(RowSnapshot.table_name, RowSnapshot.row_id).where(RowSnapshot.job_id == job_id)
+        ).all()
+    assert set(snapshots) == set(referenced_rows([*records, *lines]))
+
+    # Simulate an edit of the supplier of the first invoice after it was rendered
+    with Session(DB_ENGINE) as session:
+        supplier_id = records[0].supplier_id
+        affected = sum(
+            supplier_id in (record.supplier_id, record.customer_id) for record in records
+        )
+        snapshot = session.get(RowSnapshot, (job_id, "company", supplier_id))
+        snapshot.row_hash = "changed"
+        session.add(snapshot)
+        session.commit()
+
+    assert rerender_changed(workers=2, job_ids=[job_id]) == affected
+    assert rerender_changed(job_ids=[job_id]) == 0
+    assert len(list(tmp_path.iterdir())) == len(records)
+
+    # Invoices rendered with another template are re-rendered too
+    with Session(DB_ENGINE) as session:
+        record = session.get(InvoiceRecord, (job_id, 3))
+        record.template_hash = "old"
+        session.add(record)
+        session.commit()
+    assert rerender_changed(job_ids=[job_id]) == 1
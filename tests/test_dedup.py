@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+from generate_inv.database import RowInserter
+from generate_inv.dedup import NEAR_DUP_THRESHOLD, NearDuplicateIndex, minhash, similarity
+from generate_inv.models import InvoiceItem
+
+
+def item(item_sku: str, item_info: str) -> InvoiceItem:
+    return InvoiceItem(
+        item_sku=item_sku,
+        item_info=item_info,
+        quantity=1,
+        unit_price=Decimal("10.00"),
+        total_price=Decimal("10.00"),
+    )
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dedup.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def test_minhash_similarity():
+    monitor = minhash("Dell UltraSharp 27 Monitor")
+    assert similarity(monitor, minhash('Dell UltraSharp 27" Monitor')) == 1
+    assert similarity(monitor, minhash("Logitech MX Master 3S Mouse")) < NEAR_DUP_THRESHOLD
+
+
+def test_row_inserter_counts_near_duplicates(session):
+    insert = RowInserter(session, NearDuplicateIndex(session, InvoiceItem))
+
+    assert insert(item("MON-001", "Dell UltraSharp 27 Monitor"))
+    near_duplicate = item("MON-002", 'Dell UltraSharp 27" Monitor')
+    assert not insert(near_duplicate)
+    # Rejected before it was added, nothing to flush or roll back
+    assert near_duplicate not in session
+    assert not insert(item("MON-003", "Dell UltraSharp 27 Monitor"))
+    assert not insert(item("MON-001", "Dell UltraSharp 32 4K Monitor"))
+    assert insert(item("MOU-001", "Logitech MX Master 3S Mouse"))
+
+    assert (insert.new, insert.dup, insert.near) == (2, 2, 1)
+
+
+def test_index_backfills_existing_rows(session):
+    session.add(item("MON-001", "Dell UltraSharp 27 Monitor"))
+    session.commit()
+
+    index = NearDuplicateIndex(session, InvoiceItem)
+    assert index.find("Dell Ultrasharp 27-inch Monitor") is not None
+    assert index.find("Logitech MX Master 3S Mouse") is None
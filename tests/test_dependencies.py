@@ -0,0 +1,80 @@
+from datetime import date
+from decimal import Decimal
+
+from generate_inv.dependencies import stored_invoice
+from generate_inv.models import Address, Company, InvoiceItem, InvoiceLine, InvoiceRecord
+from generate_inv.types import Currency
+
+MOVED_ADDRESS = 3
+
+
+def _source_rows() -> dict:
+    addresses = {
+        number: Address(id=number, address_line1=f"{number} Main St", city="Toronto")
+        for number in (1, 2, MOVED_ADDRESS)
+    }
+    companies = {
+        number: Company(
+            id=number,
+            company_id=f"ABCDEF00{number}",
+            company_name=f"Company {number}",
+            # Both companies moved to another address after the invoice was rendered
+            address_billing_id=MOVED_ADDRESS,
+            phone_number="+1 (416) 456-7890",
+            email="example@example.com",
+            website="https://www.example.com",
+        )
+        for number in (1, 2)
+    }
+    items = {
+        1: InvoiceItem(
+            id=1,
+            item_sku="MON-001",
+            item_info="Dell UltraSharp 27 Monitor",
+            quantity=2,
+            unit_price=Decimal("450.00"),
+            total_price=Decimal("900.00"),
+        )
+    }
+    return {"address": addresses, "company": companies, "invoiceitem": items}
+
+
+def _record(template_hash: str) -> InvoiceRecord:
+    return InvoiceRecord(
+        job_id=1,
+        sequence=0,
+        invoice_number="INV-00000001",
+        issue_date=date(2025, 1, 1),
+        due_date=date(2025, 1, 31),
+        currency=Currency.CAD,
+        supplier_id=1,
+        customer_id=2,
+        subtotal=Decimal("900.00"),
+        tax_total=Decimal("0.00"),
+        total=Decimal("900.00"),
+        template_hash=template_hash,
+        supplier_billing_address_id=1,
+        customer_billing_address_id=2,
+    )
+
+
+LINES = [InvoiceLine(job_id=1, sequence=0, line=1, item_id=1, quantity=2)]
+
+
+def test_stored_invoice_keeps_recorded_addresses():
+    record = _record("abc")
+    invoice = stored_invoice(record, LINES, _source_rows())
+    assert invoice.supplier.address_billing_id == record.supplier_billing_address_id
+    assert invoice.customer.address_billing_id == record.customer_billing_address_id
+
+
+def test_stored_invoice_deleted_recorded_address():
+    rows = _source_rows()
+    del rows["address"][2]
+    assert stored_invoice(_record("abc"), LINES, rows) is None
+
+
+def test_stored_invoice_untracked_record():
+    invoice = stored_invoice(_record(""), LINES, _source_rows())
+    assert invoice.supplier.address_billing_id == MOVED_ADDRESS
+    assert invoice.customer.address_billing_id == MOVED_ADDRESS
@@ -0,0 +1,111 @@
+import base64
+import io
+import random
+import struct
+import time
+import zlib
+from functools import partial
+from itertools import count, islice
+from pathlib import Path
+
+import pytest
+
+from generate_inv.invoice import (
+    RENDER_QUEUE_PER_WORKER,
+    _render_in_pool,
+    compress_pdf,
+    iter_invoices,
+    layout_html,
+)
+from generate_inv.scenario import Scenario, ScenarioConfig
+from generate_inv.types import DocumentFormat, PdfOptimize
+
+
+def test_iter_invoices_matches_scenario():
+    invoices = list(iter_invoices(n=5, seed=11))
+    scenario = Scenario(ScenarioConfig(seed=11))
+    assert [invoice.invoice_number for invoice in invoices] == [
+        f"INV-{number:08d}" for number in range(1, 6)
+    ]
+    assert invoices[3] == scenario.sample(3)
+
+
+def test_iter_invoices_unbounded():
+    length = 250
+    invoices = iter_invoices(seed=11, batch=100)
+    assert len(list(islice(invoices, length))) == length
+
+
+def test_iter_invoices_rendered():
+    rendered = list(iter_invoices(n=4, seed=11, batch=2, formats=[DocumentFormat.HTML], workers=2))
+    for number, (invoice, documents) in enumerate(rendered, start=1):
+        assert invoice.invoice_number == f"INV-{number:08d}"
+        assert documents[0][0] == f"{invoice.invoice_number}.html"
+
+
+def test_iter_invoices_rendered_in_process():
+    formats = [DocumentFormat.HTML]
+    pooled = iter_invoices(n=3, seed=11, formats=formats, workers=2)
+    in_process = iter_invoices(n=3, seed=11, formats=formats)
+    assert list(pooled) == list(in_process)
+
+
+def slow_chunk(delay: float, rendered: Path, chunk: tuple) -> list:
+    time.sleep(delay)
+    rendered.joinpath(str(chunk[0])).touch()
+    return list(chunk)
+
+
+def test_render_in_pool_closes_early(tmp_path):
+    workers = 2
+    render_chunk = partial(slow_chunk, 0.2, tmp_path)
+    rendered = _render_in_pool(int, render_chunk, count(), workers, batch=1)
+    assert next(rendered) == 0
+    rendered.close()
+    # Chunks still queued when the generator is closed are cancelled, not rendered
+    assert len(list(tmp_path.iterdir())) < workers * RENDER_QUEUE_PER_WORKER
+
+
+def test_compress_pdf():
+    pikepdf = pytest.importorskip("pikepdf")
+
+    pdf = pikepdf.new()
+    page = pdf.add_blank_page()
+    text = b"BT /F1 10 Tf 72 720 Td (Dell UltraSharp 27 Monitor) Tj ET\n" * 200
+    page.Contents = pdf.make_stream(text)
+    buffer = io.BytesIO()
+    pdf.save(buffer, compress_streams=False)
+    uncompressed = buffer.getvalue()
+
+    compressed = compress_pdf(uncompressed)
+    assert len(compressed) < len(uncompressed) / 4
+    with pikepdf.open(io.BytesIO(compressed)) as document:
+        assert document.pages[0].Contents.read_bytes() == text
+
+
+def _noise_png(size: int) -> bytes:
+    """RGB PNG of random pixels, which compresses poorly"""
+    rng = random.Random(0)
+    rows = b"".join(b"\x00" + rng.randbytes(size * 3) for _ in range(size))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        checksum = zlib.crc32(kind + data)
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", checksum)
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+@pytest.mark.usefixtures("weasyprint")
+def test_pdf_optimize_size_downsamples_images():
+    image = base64.b64encode(_noise_png(600)).decode()
+    html = f'<img src="data:image/png;base64,{image}" style="width: 1in">'
+
+    original = layout_html(html, PdfOptimize.OFF).write_pdf()
+    optimized = layout_html(html, PdfOptimize.SIZE).write_pdf()
+    assert len(optimized) < len(original) / 2
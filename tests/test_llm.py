@@ -0,0 +1,172 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+from pydantic import BaseModel
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import DeltaToolCall, FunctionModel
+from pydantic_ai.models.gemini import GeminiModel
+
+from generate_inv.llm import RequestPolicy, simulated_model, stream_rows
+
+
+class Row(BaseModel):
+    name: str
+
+
+def streamed_rows(count: int) -> FunctionModel:
+    async def stream_function(messages, info):
+        tool_name = info.result_tools[0].name
+        yield {0: DeltaToolCall(name=tool_name)}
+        rows = json.dumps({"response": [{"name": f"row-{n}"} for n in range(count)]})
+        for start in range(0, len(rows), 7):
+            yield {0: DeltaToolCall(json_args=rows[start : start + 7])}
+
+    return FunctionModel(stream_function=stream_function)
+
+
+def test_stream_rows_stores_complete_rows():
+    stored = []
+    agent = Agent(model=streamed_rows(4), result_type=list[Row])
+    stream_rows(agent, "rows", lambda row: stored.append(row.name) or True, limit=10)
+    assert stored == ["row-0", "row-1", "row-2", "row-3"]
+
+
+def test_stream_rows_stops_at_limit():
+    stored = []
+    agent = Agent(model=streamed_rows(8), result_type=list[Row])
+    # Odd rows are duplicates and do not count towards the limit
+    stream_rows(agent, "rows", lambda row: stored.append(row.name) or row.name[-1] in "02468", 2)
+    assert stored == ["row-0", "row-1", "row-2"]
+
+
+def delayed_rows(delays: list[float], fail: bool = False) -> FunctionModel:
+    """Stub model answering call N after `delays[N]` seconds"""
+    calls = iter(delays)
+
+    async def respond(messages, info):
+        await asyncio.sleep(next(calls))
+        if fail:
+            raise RuntimeError("overloaded")
+        content = json.dumps({"response": [{"name": "row-0"}]})
+        return ModelResponse(parts=[ToolCallPart(info.result_tools[0].name, content)])
+
+    return FunctionModel(respond)
+
+
+def test_request_policy_hedges_slow_request():
+    agent = Agent(model=delayed_rows([5.0, 0.0]), result_type=list[Row])
+    policy = RequestPolicy(deadline=10, hedge_after=0.05)
+    started = time.perf_counter()
+    assert policy.run(agent, "rows") == [Row(name="row-0")]
+    assert time.perf_counter() - started < 1
+    assert policy.hedged == 1
+    # The cancelled slow attempt counts too, as a lower bound of its latency
+    assert len(policy.latencies) == policy.hedged + 1
+    assert max(policy.latencies) >= policy.hedge_after
+
+
+def test_request_policy_cancelled_attempt_not_below_winner():
+    # The hedge is cancelled shortly after it started, when the first attempt wins
+    delay = 0.2
+    agent = Agent(model=delayed_rows([delay, 5.0]), result_type=list[Row])
+    policy = RequestPolicy(deadline=10, hedge_after=0.05)
+    policy.run(agent, "rows")
+    assert policy.hedged == 1
+    winner, cancelled = policy.latencies
+    assert cancelled >= winner >= delay
+
+
+class GenerateContentHandler(BaseHTTPRequestHandler):
+    """Gemini API answering every request with one row"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        call = {
+            "name": request["tools"]["function_declarations"][0]["name"],
+            "args": {"response": [{"name": "row-0"}]},
+        }
+        body = json.dumps(
+            {
+                "candidates": [{"content": {"role": "model", "parts": [{"functionCall": call}]}}],
+                "usageMetadata": {"promptTokenCount": 1, "totalTokenCount": 1},
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def model_api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GenerateContentHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_request_policy_reuses_http_client(model_api):
+    # Like `cached_async_http_client()`, one client and its kept alive connections
+    # serve all requests, which fails once a request runs on a new event loop
+    model = GeminiModel(
+        "gemini-test",
+        api_key="test",
+        http_client=httpx.AsyncClient(),
+        url_template=model_api + "/{model}:",
+    )
+    agent = Agent(model=model, result_type=list[Row])
+    policy = RequestPolicy(hedge_after=None)
+    assert policy.run(agent, "rows") == [Row(name="row-0")]
+    assert policy.run(agent, "rows") == [Row(name="row-0")]
+
+
+def test_request_policy_falls_back_after_deadline():
+    agent = Agent(model=delayed_rows([5.0, 5.0]), result_type=list[Row])
+    policy = RequestPolicy(deadline=0.1, hedge_after=0.05, fallback_model=delayed_rows([0.0]))
+    assert policy.run(agent, "rows") == [Row(name="row-0")]
+    assert policy.fallbacks == 1
+
+
+def test_request_policy_fallback_shares_deadline():
+    agent = Agent(model=delayed_rows([5.0, 5.0]), result_type=list[Row])
+    deadline = 0.2
+    policy = RequestPolicy(deadline, hedge_after=None, fallback_model=delayed_rows([5.0]))
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        policy.run(agent, "rows")
+    assert time.perf_counter() - started < deadline * 2
+    assert policy.fallbacks == 1
+
+
+def test_request_policy_deadline_without_fallback():
+    agent = Agent(model=delayed_rows([5.0]), result_type=list[Row])
+    with pytest.raises(TimeoutError):
+        RequestPolicy(deadline=0.1, hedge_after=None).run(agent, "rows")
+
+
+def test_request_policy_hedge_delay_tracks_p95():
+    hedge_after = 30.0
+    policy = RequestPolicy(hedge_after=hedge_after, min_samples=20)
+    assert policy.hedge_delay() == hedge_after
+    latencies = [float(latency) for latency in range(100)]
+    policy.latencies.extend(latencies)
+    assert policy.hedge_delay() == latencies[int(len(latencies) * policy.quantile)]
+    assert RequestPolicy(hedge_after=None).hedge_delay() is None
+
+
+def test_simulated_model():
+    agent = Agent(model=simulated_model([{"name": "row-0"}], median=0.001), result_type=list[Row])
+    assert RequestPolicy().run(agent, "rows") == [Row(name="row-0")]
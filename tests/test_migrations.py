@@ -0,0 +1,60 @@
+from sqlalchemy import inspect, text
+from sqlmodel import SQLModel, create_engine
+
+from generate_inv.migrations import SCHEMA_VERSION, migrate, schema_version
+
+
+def company_indexes(engine) -> set[str]:
+    return {index["name"] for index in inspect(engine).get_indexes("company")}
+
+
+def test_migrate_existing_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    SQLModel.metadata.create_all(engine)
+    # Database created before the company address indexes existed
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_company_address_billing_id"))
+        connection.execute(text("DROP INDEX ix_company_address_shipping_id"))
+
+    assert migrate(engine) == SCHEMA_VERSION
+    assert {"ix_company_address_billing_id", "ix_company_address_shipping_id"} <= (
+        company_indexes(engine)
+    )
+    with engine.connect() as connection:
+        assert schema_version(connection) == SCHEMA_VERSION
+
+    # Applied migrations are not repeated
+    assert migrate(engine) == SCHEMA_VERSION
+    with engine.connect() as connection:
+        count = connection.execute(text("SELECT count(*) FROM schemaversion")).scalar()
+    assert count == SCHEMA_VERSION
+    engine.dispose()
+
+
+def test_migrate_new_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    SQLModel.metadata.create_all(engine)
+    assert migrate(engine) == SCHEMA_VERSION
+    engine.dispose()
+
+
+def test_migrate_invoice_dependencies(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    SQLModel.metadata.create_all(engine)
+    # Invoice records created before the template hash and address columns existed
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE invoicerecord"))
+        connection.execute(
+            text(
+                "CREATE TABLE invoicerecord (job_id INTEGER NOT NULL, sequence INTEGER NOT NULL, "
+                "invoice_number VARCHAR NOT NULL, PRIMARY KEY (job_id, sequence))"
+            )
+        )
+        connection.execute(text("INSERT INTO invoicerecord VALUES (1, 0, 'INV-1')"))
+
+    migrate(engine)
+    columns = {column["name"] for column in inspect(engine).get_columns("invoicerecord")}
+    assert {"template_hash", "customer_shipping_address_id"} <= columns
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT template_hash FROM invoicerecord")).scalar() == ""
+    engine.dispose()
@@ -0,0 +1,48 @@
+import json
+import tarfile
+import zipfile
+
+import pytest
+
+from generate_inv.output import create_writer, partial_paths, read_document
+from generate_inv.types import OutputFormat
+
+
+def test_directory_writer(tmp_path):
+    with create_writer(OutputFormat.DIR, tmp_path) as writer:
+        writer.write("INV-1", "INV-1.pdf", b"%PDF-1")
+    assert tmp_path.joinpath("INV-1.pdf").read_bytes() == b"%PDF-1"
+
+
+def test_partial_paths_of_prefix(tmp_path):
+    tmp_path.joinpath("INV-1.pdf.invoices-job1.part").touch()
+    tmp_path.joinpath("INV-1.pdf.invoices-job12.part").touch()
+    assert [path.name for path in partial_paths(tmp_path, "invoices-job1")] == [
+        "INV-1.pdf.invoices-job1.part"
+    ]
+
+
+@pytest.mark.parametrize("output_format", [OutputFormat.ZIP, OutputFormat.TAR])
+def test_archive_writer_rolls_shards(tmp_path, output_format):
+    documents = {f"INV-{number}": bytes([number]) * (700 + number) for number in range(5)}
+
+    with create_writer(output_format, tmp_path, max_docs=2) as writer:
+        for invoice_number, data in documents.items():
+            writer.write(invoice_number, f"{invoice_number}.pdf", data)
+
+    archives = sorted(tmp_path.glob(f"invoices-*.{output_format.value}"))
+    assert [archive.name for archive in archives] == [
+        f"invoices-{shard:05d}.{output_format.value}" for shard in range(3)
+    ]
+
+    if output_format == OutputFormat.ZIP:
+        with zipfile.ZipFile(archives[0]) as archive:
+            assert archive.namelist() == ["INV-0.pdf", "INV-1.pdf"]
+    else:
+        with tarfile.open(archives[0]) as archive:
+            assert archive.getnames() == ["INV-0.pdf", "INV-1.pdf"]
+
+    manifest = tmp_path.joinpath("invoices.manifest.jsonl").read_text().splitlines()
+    for line in manifest:
+        entry = json.loads(line)
+        assert read_document(tmp_path, entry) == documents[entry["invoice_number"]]
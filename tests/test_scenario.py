@@ -0,0 +1,52 @@
+from collections import Counter
+from datetime import date
+from random import Random
+
+import pytest
+from pydantic import ValidationError
+
+from generate_inv.scenario import AliasTable, ScenarioConfig, zipf_weights
+from generate_inv.types import Currency
+
+SEED = 42
+CUSTOMER_ZIPF = 1.5
+
+
+def test_alias_table_distribution():
+    weights = [1.0, 2.0, 3.0, 4.0]
+    table = AliasTable(weights)
+    rng = Random(0)
+    draws = Counter(table.sample(rng) for _ in range(100_000))
+    for index, weight in enumerate(weights):
+        assert draws[index] / 100_000 == pytest.approx(weight / sum(weights), abs=0.01)
+
+
+def test_alias_table_rejects_empty_weights():
+    with pytest.raises(ValueError):
+        AliasTable([])
+    with pytest.raises(ValueError):
+        AliasTable([0.0, 0.0])
+
+
+def test_zipf_weights():
+    assert zipf_weights(3, 1.0) == [1.0, 0.5, 1.0 / 3]
+
+
+def test_scenario_config_from_toml(tmp_path):
+    config_file = tmp_path / "scenario.toml"
+    config_file.write_text(
+        f"seed = {SEED}\ncustomer_zipf = {CUSTOMER_ZIPF}\n"
+        "[payment_terms]\n30 = 1.0\n[currencies]\nUSD = 1.0\n"
+    )
+    config = ScenarioConfig.from_toml(config_file)
+    assert config.seed == SEED
+    assert config.customer_zipf == CUSTOMER_ZIPF
+    assert config.payment_terms == {30: 1.0}
+    assert config.currencies == {Currency.USD: 1.0}
+
+
+def test_scenario_config_rejects_invalid_ranges():
+    with pytest.raises(ValidationError, match="min_line_items"):
+        ScenarioConfig(min_line_items=5, max_line_items=2)
+    with pytest.raises(ValidationError, match="end_date"):
+        ScenarioConfig(start_date=date(2025, 2, 1), end_date=date(2025, 1, 1))
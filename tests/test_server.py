@@ -0,0 +1,57 @@
+import json
+import threading
+from http import HTTPStatus
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from generate_inv.scenario import ScenarioConfig
+from generate_inv.server import InvoiceServer
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = InvoiceServer(ScenarioConfig(seed=7), port=0, workers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_invoice_json(server_url):
+    with urlopen(f"{server_url}/invoice?seed=3&format=json") as response:
+        invoice = json.load(response)
+    assert invoice["invoice_number"] == "INV-00000004"
+
+
+def test_invoice_html_is_deterministic(server_url):
+    documents = set()
+    for _ in range(2):
+        with urlopen(f"{server_url}/invoice?seed=5&format=html") as response:
+            assert response.headers["Content-Type"].startswith("text/html")
+            documents.add(response.read())
+    assert len(documents) == 1
+    assert b"INV-00000006" in documents.pop()
+
+
+def test_invoice_page_count(server_url):
+    with urlopen(f"{server_url}/invoice?seed=5&format=html") as response:
+        assert response.headers["X-Page-Count"] == "1"
+    with pytest.raises(HTTPError) as error:
+        urlopen(f"{server_url}/invoice?seed=5&format=html&page=2")
+    assert error.value.code == HTTPStatus.NOT_FOUND
+
+
+def test_invoice_bad_seed(server_url):
+    with pytest.raises(HTTPError) as error:
+        urlopen(f"{server_url}/invoice?seed=abc")
+    assert error.value.code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.usefixtures("weasyprint")
+def test_warm_up_every_worker():
+    workers = 2
+    with InvoiceServer(ScenarioConfig(seed=7), port=0, workers=workers) as server:
+        assert len(server.warm_up()) == workers
@@ -0,0 +1,44 @@
+import pytest
+from sqlmodel import Session
+
+from generate_inv.database import DB_ENGINE
+from generate_inv.models import Address, ColumnStats
+from generate_inv.stats import HyperLogLog, get_stats, record_rows
+
+
+@pytest.mark.parametrize("distinct", [0, 13, 1_000, 50_000])
+def test_hyperloglog_count(distinct):
+    sketch = HyperLogLog()
+    for value in range(distinct):
+        sketch.add(f"value-{value}")
+        sketch.add(f"value-{value}")
+    assert sketch.count() == pytest.approx(distinct, rel=0.05, abs=1)
+
+
+def test_hyperloglog_registers_round_trip():
+    sketch = HyperLogLog()
+    for value in range(100):
+        sketch.add(value)
+    restored = HyperLogLog(bytes(sketch.registers))
+    restored.add(1)
+    assert restored.count() == sketch.count()
+
+
+def test_record_rows_updates_distinct_counts():
+    _, column_stats = get_stats(exact=True)
+    cities = next(stats for stats in column_stats if stats.column_name == "city").distinct_count
+
+    with Session(DB_ENGINE) as session:
+        session.add(
+            Address(
+                address_line1="1 Sketch Rd",
+                address_line2="",
+                city="Sketchville",
+                province="ON",
+                postal_code="K1A 0B1",
+            )
+        )
+        record_rows(session, Address, 1)
+        session.commit()
+        stats = session.get(ColumnStats, ("address", "city"))
+        assert stats.distinct_count == cities + 1